@@ -1,10 +1,125 @@
+import asyncio
+import os
 import sys
-from flask import Flask, Response, jsonify, request
-from flask_cors import CORS
-import requests
+from urllib.parse import urlencode
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
 
-app = Flask(__name__)
-CORS(app, origins=["http://localhost:3000"])
+from compression import (
+    ENCODINGS, compress, compress_responses, decompress, encoded_etag, matching_etag, negotiate_encoding,
+    strip_encoding,
+)
+from metrics import SSE_STREAMS, track_requests
+from response_cache import CachedResponse, ResponseCache
+from upstream import CircuitOpenError, DeadlineExceeded, Upstream
+
+# Served by Hypercorn on an event loop, so proxied status streams are
+# coroutines waiting on sockets rather than threads
+app = Quart(__name__)
+app = cors(app, allow_origin=["http://localhost:3000"])
+track_requests(app)
+compress_responses(app)
+
+SERVER_CONTROLLER_URL = os.environ.get("SERVER_CONTROLLER_URL", "http://server-controller-sv:31003")
+SERVER_TEMPLATES_URL = os.environ.get("SERVER_TEMPLATES_URL", "http://server-templates-api-sv:31002")
+
+# One keep-alive connection pool and circuit breaker per backend service
+server_controller = Upstream("server-controller", SERVER_CONTROLLER_URL)
+server_templates = Upstream("server-templates", SERVER_TEMPLATES_URL)
+UPSTREAMS = (server_controller, server_templates)
+
+
+@app.before_serving
+async def open_upstreams():
+    for upstream in UPSTREAMS:
+        upstream.open()
+
+
+@app.after_serving
+async def close_upstreams():
+    for upstream in UPSTREAMS:
+        await upstream.aclose()
+
+
+# Short-lived cache for the list GETs every dashboard makes on load
+response_cache = ResponseCache(
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 2)),
+    stale_ttl=float(os.environ.get("RESPONSE_CACHE_STALE_TTL", 10)),
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 256)),
+)
+
+
+# Function to answer a GET from the response cache, sharing one upstream call
+# between concurrent identical requests. Query args are passed through and are
+# part of the cache key. Bodies are fetched and kept compressed, revalidated
+# upstream with their ETag, and only decompressed for clients that can't take
+# them as they are.
+async def cached_get(upstream, path, route):
+    params = sorted(request.args.items(multi=True))
+    key = request.path + (f"?{urlencode(params)}" if params else "")
+
+    async def fetch(entry):
+        headers = {"Accept-Encoding": ", ".join(ENCODINGS)}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        response = await upstream.request("GET", path, route, stream=True, params=params, headers=headers)
+        try:
+            if response.status_code == 304 and entry is not None:
+                return entry.revalidated()
+            # Raw, so a compressed body stays compressed
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+        return CachedResponse(
+            response.status_code, body, response.headers.get("content-type", "application/json"),
+            etag=response.headers.get("etag"), encoding=response.headers.get("content-encoding"),
+        )
+
+    entry, outcome = await response_cache.get(key, route, fetch)
+    etag = strip_encoding(entry.etag.strip('"')) if entry.status == 200 and entry.etag else None
+
+    tag = matching_etag(etag, request.if_none_match) if etag else None
+    if tag is not None:
+        response = Response(status=304)
+        response.set_etag(tag)
+    else:
+        body, encoding = entry.body, entry.encoding
+        if encoding and request.accept_encodings[encoding] <= 0:
+            body = decompress(body, encoding)
+            encoding = negotiate_encoding(request.accept_encodings)
+            if encoding:
+                body = compress(body, encoding)
+        response = Response(body, entry.status, content_type=entry.content_type)
+        response.vary.add("Accept-Encoding")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding) if encoding else etag)
+
+    if etag:
+        # Let browsers keep a copy, but check back (with If-None-Match) every time
+        response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Cache"] = outcome.upper()
+    return response
+
+
+# Function to turn a failed upstream call into an error response: 503 while
+# the upstream is marked down, 504 when it didn't answer in time
+def upstream_error(e, message):
+    print(f"{message}: {e}", file=sys.stderr)
+    if isinstance(e, CircuitOpenError):
+        return jsonify({"message": message}), 503
+    if isinstance(e, DeadlineExceeded):
+        return jsonify({"message": message}), 504
+    return jsonify({"message": message}), 500
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 
 @app.get("/")
@@ -18,95 +133,261 @@ def hello():
 # ----- Server Controller -----
 
 @app.get("/servers")
-def get_server_list():
+async def get_server_list():
+    # Filters and pagination (status, type, version, limit, continue) pass straight through
     try:
-        response = requests.get('http://server-controller-sv:31003/status')
-        return response.json()
+        return await cached_get(server_controller, "/list", "/list")
     except Exception as e:
-        return jsonify({"message": f"Error fetching server list"}), 500
+        return upstream_error(e, "Error fetching server list")
 
 
 @app.get("/servers/status/all")
-def servers_status_stream():
-    # Forward the SSE request to the backend
-    backend_url = 'http://server-controller-sv:31003/status/all'  # Adjust to your backend URL
+async def servers_status_stream():
+    # Pass the resume position through so the backend only replays missed events
+    headers = {}
+    if "Last-Event-ID" in request.headers:
+        headers["Last-Event-ID"] = request.headers["Last-Event-ID"]
+
+    # Connect before answering, so a down backend is an error rather than an empty stream.
+    # The deadline covers getting the headers; the stream itself is open-ended.
+    try:
+        backend_response = await server_controller.request(
+            "GET", "/status/all", "/status/all", stream=True, headers=headers
+        )
+    except Exception as e:
+        return upstream_error(e, "Error opening status stream")
+
+    if backend_response.status_code != 200:
+        await backend_response.aclose()
+        return jsonify({"message": "Error opening status stream"}), backend_response.status_code
 
-    def stream():
-        with requests.get(backend_url, stream=True) as backend_response:
-            for line in backend_response.iter_lines():
-                if line:
-                    yield f"data: {line.decode('utf-8')}\n\n"
+    async def stream():
+        # Events are already framed by the backend (id/event/data), relay them as-is
+        SSE_STREAMS.inc()
+        try:
+            async for chunk in backend_response.aiter_raw():
+                yield chunk
+        finally:
+            await backend_response.aclose()
+            SSE_STREAMS.dec()
 
-    return Response(stream(), mimetype='text/event-stream')
+    response = Response(stream(), mimetype='text/event-stream')
+    response.timeout = None
+    return response
 
 
 @app.post("/servers/create")
-def create_server():
+async def create_server():
     try:
-        body = request.get_json()
-        response = requests.post('http://server-controller-sv:31003/create-server', json=body)
-        return response.json()
+        body = await request.get_json()
+        # Only queues the install, but may wait on the port allocator, job queue
+        # and (with ?template=<id>) the template service
+        response = await server_controller.request(
+            "POST", "/create-server", "/create-server", deadline=10, json=body,
+            params=list(request.args.items(multi=True)),
+        )
+        response_cache.invalidate("/servers")
+        return response.json(), response.status_code
     except Exception as e:
-        return jsonify({"message": f"Error creating server"}), 500
+        return upstream_error(e, "Error creating server")
 
 
 @app.post("/servers/<server_id>/start")
-def start_server(server_id):
+async def start_server(server_id):
     try:
-        response = requests.post(f"http://server-controller-sv:31003/{server_id}/start")
-        return response.json()
+        response = await server_controller.request("POST", f"/{server_id}/start", "/<id>/start")
+        response_cache.invalidate("/servers")
+        return response.json(), response.status_code
     except Exception as e:
-        return jsonify({"message": f"Error starting server"}), 500
+        return upstream_error(e, "Error starting server")
 
 
 @app.post("/servers/<server_id>/stop")
-def stop_server(server_id):
+async def stop_server(server_id):
     try:
-        response = requests.post(f"http://server-controller-sv:31003/{server_id}/stop")
-        return response.json()
+        response = await server_controller.request("POST", f"/{server_id}/stop", "/<id>/stop")
+        response_cache.invalidate("/servers")
+        return response.json(), response.status_code
     except Exception as e:
-        return jsonify({"message": f"Error stopping server"}), 500
+        return upstream_error(e, "Error stopping server")
 
 
 @app.delete("/servers/<server_id>")
-def delete_server(server_id):
+async def delete_server(server_id):
+    try:
+        response = await server_controller.request("DELETE", f"/{server_id}", "/<id>")
+        response_cache.invalidate("/servers")
+        return response.json(), response.status_code
+    except Exception as e:
+        return upstream_error(e, "Error deleting server")
+
+@app.get("/servers/<server_id>/history")
+async def get_server_history(server_id):
+    try:
+        response = await server_controller.request(
+            "GET", f"/{server_id}/history", "/<id>/history", params=list(request.args.items(multi=True))
+        )
+        return response.json(), response.status_code
+    except Exception as e:
+        return upstream_error(e, "Error fetching server history")
+
+
+@app.post("/servers/bulk")
+async def bulk_server_action():
+    # Per-server results are streamed back as NDJSON while the action runs.
+    # The deadline covers getting the headers, not the whole action.
+    try:
+        backend_response = await server_controller.request(
+            "POST", "/bulk", "/bulk", deadline=10, stream=True, json=await request.get_json()
+        )
+    except Exception as e:
+        return upstream_error(e, "Error running bulk action")
+    response_cache.invalidate("/servers")
+
+    if backend_response.status_code != 200:
+        await backend_response.aread()
+        await backend_response.aclose()
+        return backend_response.json(), backend_response.status_code
+
+    async def stream():
+        try:
+            async for chunk in backend_response.aiter_raw():
+                yield chunk
+        finally:
+            await backend_response.aclose()
+            # Lists fetched while the action ran may be half-updated
+            response_cache.invalidate("/servers")
+
+    response = Response(stream(), mimetype='application/x-ndjson')
+    response.timeout = None
+    return response
+
+
+@app.get("/servers/jobs/<job_id>")
+async def get_server_job(job_id):
     try:
-        response = requests.delete(f"http://server-controller-sv:31003/{server_id}")
-        return response.json()
+        response = await server_controller.request("GET", f"/jobs/{job_id}", "/jobs/<id>")
+        return response.json(), response.status_code
     except Exception as e:
-        return jsonify({"message": f"Error deleting server"}), 500
+        return upstream_error(e, "Error fetching job status")
 
 # ----- Server Templates -----
 
 @app.get("/server-templates")
-def get_server_templates_list():
+async def get_server_templates_list():
     try:
-        response = requests.get('http://server-templates-api-sv:31002/template')
-        print(response, file=sys.stderr)
-        return response.json()
+        return await cached_get(server_templates, "/template", "/template")
     except Exception as e:
-        return jsonify({"message": f"Error fetching server list"}), 500
+        return upstream_error(e, "Error fetching server list")
+
+
+@app.get("/server-templates/search")
+async def search_server_templates():
+    try:
+        return await cached_get(server_templates, "/template/search", "/template/search")
+    except Exception as e:
+        return upstream_error(e, "Error searching server templates")
+
+
+@app.get("/server-templates/autocomplete")
+async def autocomplete_server_templates():
+    try:
+        return await cached_get(server_templates, "/template/autocomplete", "/template/autocomplete")
+    except Exception as e:
+        return upstream_error(e, "Error fetching template suggestions")
+
+
+# Imports write in batches upstream and answer once the whole upload is in
+IMPORT_DEADLINE = 300
+
+
+@app.get("/server-templates/export")
+async def export_server_templates():
+    # NDJSON relayed as it arrives, still compressed if the backend compressed it
+    headers = {"Accept-Encoding": request.headers.get("Accept-Encoding", "identity")}
+    try:
+        backend_response = await server_templates.request(
+            "GET", "/template/export", "/template/export", stream=True, headers=headers
+        )
+    except Exception as e:
+        return upstream_error(e, "Error exporting server templates")
+
+    if backend_response.status_code != 200:
+        await backend_response.aclose()
+        return jsonify({"message": "Error exporting server templates"}), backend_response.status_code
+
+    async def stream():
+        try:
+            async for chunk in backend_response.aiter_raw():
+                yield chunk
+        finally:
+            await backend_response.aclose()
+
+    response = Response(stream(), mimetype='application/x-ndjson')
+    if "content-encoding" in backend_response.headers:
+        response.headers["Content-Encoding"] = backend_response.headers["content-encoding"]
+    response.vary.add("Accept-Encoding")
+    response.timeout = None
+    return response
+
+
+@app.post("/server-templates/import")
+async def import_server_templates():
+    # The NDJSON upload is passed upstream chunk by chunk as it arrives
+    try:
+        response = await server_templates.request(
+            "POST", "/template/import", "/template/import", deadline=IMPORT_DEADLINE,
+            content=request.body, headers={"Content-Type": "application/x-ndjson"},
+        )
+        response_cache.invalidate("/server-templates")
+        return response.json(), response.status_code
+    except Exception as e:
+        return upstream_error(e, "Error importing server templates")
 
 
 @app.get('/server-templates/<template_id>')
-def get_server_template(template_id):
-    pass
+async def get_server_template(template_id):
+    try:
+        return await cached_get(server_templates, f"/template/{template_id}", "/template/<id>")
+    except Exception as e:
+        return upstream_error(e, "Error fetching server template")
 
 
 @app.post("/server-templates")
-def create_server_template():
-    pass
+async def create_server_template():
+    try:
+        response = await server_templates.request(
+            "POST", "/template", "/template", json=await request.get_json()
+        )
+        response_cache.invalidate("/server-templates")
+        return response.json(), response.status_code
+    except Exception as e:
+        return upstream_error(e, "Error creating server template")
 
 
 @app.put('/server-templates/<template_id>')
-def update_server_template(template_id):
-    pass
+async def update_server_template(template_id):
+    try:
+        response = await server_templates.request(
+            "PUT", f"/template/{template_id}", "/template/<id>", json=await request.get_json()
+        )
+        response_cache.invalidate("/server-templates")
+        return response.json(), response.status_code
+    except Exception as e:
+        return upstream_error(e, "Error updating server template")
 
 
 @app.delete("/server-templates/<template_id>")
-def delete_server_template(template_id):
-    pass
+async def delete_server_template(template_id):
+    try:
+        response = await server_templates.request("DELETE", f"/template/{template_id}", "/template/<id>")
+        response_cache.invalidate("/server-templates")
+        return response.json(), response.status_code
+    except Exception as e:
+        return upstream_error(e, "Error deleting server template")
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0")
+    hypercorn_config = Config()
+    hypercorn_config.bind = [f"0.0.0.0:{int(os.environ.get('PORT', 5000))}"]
+    asyncio.run(serve(app, hypercorn_config))
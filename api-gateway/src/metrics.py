@@ -0,0 +1,40 @@
+import time
+
+from quart import g, request
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ["method", "endpoint", "status"]
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Time spent waiting on upstream services", ["upstream", "route", "status"]
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Failed calls to upstream services", ["upstream", "route", "reason"]
+)
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Retried calls to upstream services", ["upstream", "route"])
+CIRCUIT_OPEN = Gauge("upstream_circuit_open", "Whether calls to an upstream are being failed fast", ["upstream"])
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total", "Cacheable GETs by outcome (hit, stale, coalesced, miss)", ["route", "outcome"]
+)
+RESPONSE_CACHE_ENTRIES = Gauge("response_cache_entries", "Responses held in the gateway cache")
+SSE_STREAMS = Gauge("sse_streams", "Open /servers/status/all streams")
+
+
+def track_requests(app):
+    """Record the latency of every request, labelled by route rather than raw path."""
+
+    # Async hooks run on the event loop; sync ones would each take a thread hop
+    @app.before_request
+    async def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    async def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_REQUEST_DURATION.labels(request.method, endpoint, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+
+from metrics import RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_REQUESTS
+
+
+class CachedResponse:
+    """An upstream response as received: `body` is still in `encoding`, if any."""
+
+    def __init__(self, status, body, content_type, etag=None, encoding=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.encoding = encoding
+        self.fetched_at = time.monotonic()
+
+    def revalidated(self):
+        # The upstream answered 304: same body, fresh again
+        return CachedResponse(self.status, self.body, self.content_type, self.etag, self.encoding)
+
+    def age(self, now):
+        return now - self.fetched_at
+
+
+class ResponseCache:
+    """
+    Caches upstream GET responses for a few seconds and shares in-flight calls.
+
+    Concurrent `get`s for the same key wait on one upstream call (single
+    flight). Successful responses are kept for `ttl` seconds, then served
+    stale for up to `stale_ttl` more while a single background call refreshes
+    them; the stale copy is also served if that refresh fails. At most
+    `max_entries` responses are kept, evicting the least recently used.
+
+    `invalidate` drops entries by key prefix. A call that was already in
+    flight when its entry was invalidated still answers the requests waiting
+    on it, but its result isn't stored and new requests don't join it.
+    """
+
+    def __init__(self, ttl=2, stale_ttl=10, max_entries=256):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        # Bumped by invalidate, so calls started before it don't store their results
+        self._generation = 0
+
+    async def get(self, key, route, fetch):
+        """
+        Returns (CachedResponse, outcome) for `key`, calling `fetch` upstream
+        when needed. `fetch` gets the entry being refreshed (or None), so it
+        can revalidate it, and returns a CachedResponse; only 200s are stored.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = entry.age(now)
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return self._count(route, entry, "hit")
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self._start_fetch(key, fetch)
+                return self._count(route, entry, "stale")
+
+        outcome = "coalesced" if key in self._inflight else "miss"
+        task = self._start_fetch(key, fetch)
+        try:
+            # Shielded: one client going away mustn't cancel the call for the others
+            return self._count(route, await asyncio.shield(task), outcome)
+        except Exception:
+            # Better an old answer than none while the upstream is struggling
+            entry = self._entries.get(key)
+            if entry is not None and entry.age(time.monotonic()) < self.ttl + self.stale_ttl:
+                return self._count(route, entry, "stale")
+            raise
+
+    def _count(self, route, entry, outcome):
+        RESPONSE_CACHE_REQUESTS.labels(route, outcome).inc()
+        return entry, outcome
+
+    def _start_fetch(self, key, fetch):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, fetch, self._generation))
+            self._inflight[key] = task
+            # Background refreshes have nobody awaiting them; _fetch already logged any error
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return task
+
+    async def _fetch(self, key, fetch, generation):
+        try:
+            entry = await fetch(self._entries.get(key))
+            if entry.status == 200 and generation == self._generation:
+                self._store(key, entry)
+            return entry
+        except Exception as e:
+            print(f"Error fetching {key} for the response cache: {e}")
+            raise
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        RESPONSE_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate(self, prefix):
+        self._generation += 1
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+        # Later requests make a fresh call instead of joining one that may be out of date
+        for key in [key for key in self._inflight if key.startswith(prefix)]:
+            del self._inflight[key]
+        RESPONSE_CACHE_ENTRIES.set(len(self._entries))
@@ -0,0 +1,172 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from metrics import CIRCUIT_OPEN, UPSTREAM_DURATION, UPSTREAM_ERRORS, UPSTREAM_RETRIES
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Responses that mean the upstream itself is unwell, rather than the request being bad
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while an upstream is down.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are rejected without being sent. Once `reset_timeout` seconds have passed
+    a single trial call is let through (half-open): if it succeeds the circuit
+    closes again, if it fails it stays open for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def cancel_trial(self):
+        # The trial call was abandoned without an answer either way
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+
+class Upstream:
+    """
+    A backend service behind the gateway: one pooled, keep-alive HTTP client,
+    a circuit breaker, and per-call deadlines and retries.
+
+    `deadline` bounds the whole call, retries included (for streamed
+    responses, until the headers arrive). Calls with an idempotent method are
+    retried up to `retries` times, with jittered backoff, on connection errors,
+    timeouts and 502/503/504 answers.
+    """
+
+    def __init__(self, name, base_url, deadline=5.0, retries=2, backoff=0.1,
+                 failure_threshold=5, reset_timeout=10, max_keepalive_connections=20):
+        self.name = name
+        self.base_url = base_url
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_keepalive_connections = max_keepalive_connections
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.client = None
+        CIRCUIT_OPEN.labels(name).set(0)
+
+    def open(self):
+        # Deadlines are enforced per call, so the client itself never times out.
+        # No cap on connections: every proxied status stream holds one open.
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=None,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.max_keepalive_connections),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def _record(self, route, failed, reason=None):
+        if failed:
+            UPSTREAM_ERRORS.labels(self.name, route, reason).inc()
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        CIRCUIT_OPEN.labels(self.name).set(1 if self.breaker.state != "closed" else 0)
+
+    async def request(self, method, path, route, deadline=None, stream=False, retry=None, **kwargs):
+        """
+        Send a request and return the httpx response. A streamed response has
+        to be closed by the caller. Raises CircuitOpenError without sending
+        anything while the upstream is marked down, and DeadlineExceeded when
+        no answer came in time.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        retry = method in IDEMPOTENT_METHODS if retry is None else retry
+        attempts = 1 + (self.retries if retry else 0)
+        expires = time.monotonic() + deadline
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                UPSTREAM_ERRORS.labels(self.name, route, "circuit_open").inc()
+                raise CircuitOpenError(f"{self.name} is unavailable")
+
+            start = time.perf_counter()
+            status = "error"
+            try:
+                request = self.client.build_request(method, path, **kwargs)
+                response = await asyncio.wait_for(
+                    self.client.send(request, stream=stream), expires - time.monotonic()
+                )
+                status = response.status_code
+            except asyncio.TimeoutError:
+                self._record(route, True, "timeout")
+                error = DeadlineExceeded(f"{self.name} did not answer within {deadline}s")
+            except httpx.TransportError as e:
+                self._record(route, True, type(e).__name__)
+                error = UpstreamError(f"{self.name} request failed: {e}")
+            except asyncio.CancelledError:
+                # The client went away
+                self.breaker.cancel_trial()
+                raise
+            else:
+                # Other errors are about the request, not the upstream's health
+                failed = status in RETRYABLE_STATUSES
+                self._record(route, failed, str(status) if failed else None)
+                error = None
+            finally:
+                UPSTREAM_DURATION.labels(self.name, route, status).observe(time.perf_counter() - start)
+
+            # Retry only if there's time left for the backoff and another try
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            can_retry = attempt < attempts - 1 and time.monotonic() + delay < expires
+            if error is None:
+                if status not in RETRYABLE_STATUSES or not can_retry:
+                    return response
+                await response.aclose()
+            elif not can_retry:
+                raise error
+            UPSTREAM_RETRIES.labels(self.name, route).inc()
+            await asyncio.sleep(delay)
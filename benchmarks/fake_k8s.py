@@ -0,0 +1,375 @@
+"""
+Stand-in for the parts of the Kubernetes API the server controller uses.
+
+Serves N pre-created Minecraft server Deployments and Services, supports
+list (with label selectors and limit/continue), watch, merge patches,
+server-side apply and delete, and counts every call so a benchmark can report
+API calls per request (GET /_bench/stats, POST /_bench/reset).
+"""
+import argparse
+import copy
+import json
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# plural -> (group, version, kind)
+RESOURCES = {
+    "deployments": ("apps", "v1", "Deployment"),
+    "statefulsets": ("apps", "v1", "StatefulSet"),
+    "services": ("", "v1", "Service"),
+    "configmaps": ("", "v1", "ConfigMap"),
+    "secrets": ("", "v1", "Secret"),
+    "persistentvolumeclaims": ("", "v1", "PersistentVolumeClaim"),
+}
+VERBS = ["create", "delete", "get", "list", "patch", "update", "watch"]
+
+
+def parse_selector(selector):
+    requirements = []
+    for part in filter(None, (p.strip() for p in (selector or "").split(","))):
+        if "!=" in part:
+            key, value = part.split("!=", 1)
+            requirements.append((key, "!=", value))
+        elif "=" in part:
+            key, value = part.replace("==", "=").split("=", 1)
+            requirements.append((key, "=", value))
+        elif part.startswith("!"):
+            requirements.append((part[1:], "!", None))
+        else:
+            requirements.append((part, "exists", None))
+    return requirements
+
+
+def matches(labels, requirements):
+    labels = labels or {}
+    for key, op, value in requirements:
+        if op == "=" and labels.get(key) != value:
+            return False
+        if op == "!=" and labels.get(key) == value:
+            return False
+        if op == "!" and key in labels:
+            return False
+        if op == "exists" and key not in labels:
+            return False
+    return True
+
+
+def merge_patch(target, patch):
+    # JSON merge patch (RFC 7386); close enough to the strategic merge patches the controller sends
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    target = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+
+def server_objects(release, node_port, server_type="VANILLA", version="LATEST"):
+    name = f"{release}-minecraft"
+    labels = {
+        "app": name,
+        "release": release,
+        "heritage": "Helm",
+        "app.kubernetes.io/managed-by": "Helm",
+        "mc-server-manager/managed": "true",
+    }
+    deployment = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {"name": name, "namespace": "default", "labels": labels, "annotations": {}},
+        "spec": {
+            "replicas": 1,
+            "selector": {"matchLabels": {"app": name}},
+            "template": {
+                "metadata": {"labels": {"app": name}},
+                "spec": {"containers": [{
+                    "name": name,
+                    "image": "itzg/minecraft-server:latest",
+                    "env": [{"name": "TYPE", "value": server_type}, {"name": "VERSION", "value": version}],
+                }]},
+            },
+        },
+    }
+    service = {
+        "apiVersion": "v1",
+        "kind": "Service",
+        "metadata": {"name": name, "namespace": "default", "labels": labels, "annotations": {}},
+        "spec": {
+            "type": "NodePort",
+            "selector": {"app": name},
+            "ports": [{"name": "minecraft", "port": 25565, "targetPort": 25565, "nodePort": node_port,
+                       "protocol": "TCP"}],
+        },
+    }
+    return deployment, service
+
+
+class Store:
+    def __init__(self):
+        self.objects = {plural: {} for plural in RESOURCES}
+        self.events = []
+        self.resource_version = 1
+        self.calls = Counter()
+        self.cond = threading.Condition()
+
+    def _stamp(self, plural, obj):
+        self.resource_version += 1
+        metadata = obj.setdefault("metadata", {})
+        metadata["resourceVersion"] = str(self.resource_version)
+        metadata.setdefault("namespace", "default")
+        metadata.setdefault("uid", f"{plural}-{metadata['name']}")
+        group, version, kind = RESOURCES[plural]
+        obj["apiVersion"] = f"{group}/{version}" if group else version
+        obj["kind"] = kind
+        if plural == "deployments":
+            # Pods come up instantly
+            replicas = obj["spec"].get("replicas", 1)
+            obj["status"] = {"replicas": replicas, "readyReplicas": replicas, "availableReplicas": replicas}
+
+    def put(self, plural, obj, notify=True):
+        with self.cond:
+            event_type = "MODIFIED" if obj["metadata"]["name"] in self.objects[plural] else "ADDED"
+            self._stamp(plural, obj)
+            self.objects[plural][obj["metadata"]["name"]] = obj
+            if notify:
+                self.events.append((self.resource_version, plural, event_type, copy.deepcopy(obj)))
+                self.cond.notify_all()
+            return obj
+
+    def delete(self, plural, name):
+        with self.cond:
+            obj = self.objects[plural].pop(name, None)
+            if obj is None:
+                return None
+            self.resource_version += 1
+            obj["metadata"]["resourceVersion"] = str(self.resource_version)
+            self.events.append((self.resource_version, plural, "DELETED", obj))
+            self.cond.notify_all()
+            return obj
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _status(self, code, reason, message):
+        self._send(code, {"kind": "Status", "apiVersion": "v1", "status": "Failure",
+                          "reason": reason, "message": message, "code": code})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _route(self):
+        """Returns (plural, name, subresource, cluster_wide) for resource paths, or None."""
+        parts = [p for p in self.url.path.split("/") if p]
+        if parts[:1] == ["api"]:
+            parts = parts[2:]
+        elif parts[:1] == ["apis"]:
+            parts = parts[3:]
+        else:
+            return None
+        if parts[:1] == ["namespaces"] and len(parts) >= 3:
+            parts, cluster_wide = parts[2:], False
+        else:
+            cluster_wide = True
+        if not parts or parts[0] not in RESOURCES:
+            return None
+        return parts[0], (parts[1] if len(parts) > 1 else None), (parts[2] if len(parts) > 2 else None), cluster_wide
+
+    def _count(self, route, query):
+        if route is None:
+            self.store.calls[f"{self.command} {self.url.path}"] += 1
+            return
+        plural, name, subresource, cluster_wide = route
+        verb = {"GET": "get" if name else "list", "PATCH": "patch", "DELETE": "delete",
+                "POST": "create", "PUT": "update"}[self.command]
+        if "apply-patch" in self.headers.get("Content-Type", ""):
+            verb = "apply"
+        if query.get("watch") in ("true", "True", "1"):
+            verb = "watch"
+        resource = f"{plural}/{subresource}" if subresource else plural
+        self.store.calls[f"{verb} {resource}{' (all namespaces)' if cluster_wide else ''}"] += 1
+
+    def _handle(self):
+        self.url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(self.url.query).items()}
+
+        if self.url.path == "/_bench/stats":
+            calls = dict(self.store.calls)
+            return self._send(200, {"calls": calls, "total": sum(calls.values())})
+        if self.url.path == "/_bench/reset":
+            self.store.calls.clear()
+            return self._send(200, {})
+
+        route = self._route()
+        self._count(route, query)
+        if route is None:
+            return self._discovery()
+
+        plural, name, subresource, cluster_wide = route
+        if self.command == "GET" and name is None:
+            if query.get("watch") in ("true", "True", "1"):
+                return self._watch(plural, query)
+            return self._list(plural, query)
+        if name is None:
+            return self._status(405, "MethodNotAllowed", "not supported")
+
+        if self.command == "GET":
+            obj = self.store.objects[plural].get(name)
+            if obj is None:
+                return self._status(404, "NotFound", f"{plural} {name} not found")
+            return self._send(200, obj)
+        if self.command == "DELETE":
+            obj = self.store.delete(plural, name)
+            if obj is None:
+                return self._status(404, "NotFound", f"{plural} {name} not found")
+            return self._send(200, obj)
+        if self.command == "PATCH":
+            return self._patch(plural, name, subresource)
+        return self._status(405, "MethodNotAllowed", "not supported")
+
+    def _discovery(self):
+        path = self.url.path.rstrip("/")
+        if path == "/version":
+            return self._send(200, {"major": "1", "minor": "30", "gitVersion": "v1.30.0-bench"})
+        if path == "/api":
+            return self._send(200, {"kind": "APIVersions", "versions": ["v1"]})
+        if path == "/apis":
+            return self._send(200, {"kind": "APIGroupList", "apiVersion": "v1", "groups": [{
+                "name": "apps",
+                "versions": [{"groupVersion": "apps/v1", "version": "v1"}],
+                "preferredVersion": {"groupVersion": "apps/v1", "version": "v1"},
+            }]})
+        if path in ("/api/v1", "/apis/apps/v1"):
+            group = "apps" if path.startswith("/apis") else ""
+            resources = []
+            for plural, (g, version, kind) in RESOURCES.items():
+                if g != group:
+                    continue
+                resources.append({"name": plural, "singularName": kind.lower(), "namespaced": True,
+                                  "kind": kind, "verbs": VERBS})
+                if plural == "deployments":
+                    resources.append({"name": "deployments/scale", "singularName": "", "namespaced": True,
+                                      "group": "autoscaling", "version": "v1", "kind": "Scale",
+                                      "verbs": ["get", "patch", "update"]})
+            return self._send(200, {"kind": "APIResourceList", "groupVersion": path.split("/", 2)[-1],
+                                    "resources": resources})
+        return self._status(404, "NotFound", f"{path} not found")
+
+    def _list(self, plural, query):
+        requirements = parse_selector(query.get("labelSelector"))
+        with self.store.cond:
+            resource_version = str(self.store.resource_version)
+            items = [
+                obj for name, obj in sorted(self.store.objects[plural].items())
+                if matches(obj["metadata"].get("labels"), requirements)
+            ]
+        offset = int(query.get("continue") or 0)
+        limit = int(query.get("limit") or 0)
+        page = items[offset:offset + limit] if limit else items[offset:]
+        more = limit and offset + limit < len(items)
+        group, version, kind = RESOURCES[plural]
+        self._send(200, {
+            "apiVersion": f"{group}/{version}" if group else version,
+            "kind": f"{kind}List",
+            "metadata": {"resourceVersion": resource_version, "continue": str(offset + limit) if more else None},
+            "items": page,
+        })
+
+    def _watch(self, plural, query):
+        requirements = parse_selector(query.get("labelSelector"))
+        since = int(query.get("resourceVersion") or 0)
+        deadline = time.monotonic() + int(query.get("timeoutSeconds") or 300)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            while True:
+                with self.store.cond:
+                    pending = [e for e in self.store.events if e[0] > since]
+                    if not pending:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.store.cond.wait(min(remaining, 5))
+                        continue
+                for resource_version, event_plural, event_type, obj in pending:
+                    since = resource_version
+                    if event_plural == plural and matches(obj["metadata"].get("labels"), requirements):
+                        write(json.dumps({"type": event_type, "object": obj}).encode() + b"\n")
+            write(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _patch(self, plural, name, subresource):
+        body = self._body()
+        content_type = self.headers.get("Content-Type", "")
+        current = self.store.objects[plural].get(name)
+
+        if "apply-patch" in content_type:
+            obj = merge_patch(current or {}, body) if current else body
+            obj.pop("status", None)
+            return self._send(200, self.store.put(plural, obj))
+        if current is None:
+            return self._status(404, "NotFound", f"{plural} {name} not found")
+        if subresource == "scale":
+            obj = copy.deepcopy(current)
+            obj["spec"]["replicas"] = body["spec"]["replicas"]
+            self.store.put(plural, obj)
+            return self._send(200, {"apiVersion": "autoscaling/v1", "kind": "Scale",
+                                    "metadata": {"name": name, "namespace": "default"},
+                                    "spec": {"replicas": obj["spec"]["replicas"]}})
+        return self._send(200, self.store.put(plural, merge_patch(current, body)))
+
+    do_GET = do_PATCH = do_DELETE = do_POST = do_PUT = _handle
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--servers", type=int, default=100, help="Minecraft servers to pre-create")
+    parser.add_argument("--node-port-base", type=int, default=30000)
+    args = parser.parse_args()
+
+    store = Store()
+    for i in range(args.servers):
+        deployment, service = server_objects(f"mc-bench-{i:05d}", args.node_port_base + i)
+        store.put("deployments", deployment, notify=False)
+        store.put("services", service, notify=False)
+
+    Handler.store = store
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.daemon_threads = True
+    print(f"Fake Kubernetes API with {args.servers} servers on :{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Emulates a fleet of Minecraft servers answering Server List Ping.
+
+Listens on `count` consecutive ports starting at `base-port`, one per server.
+Each server answers status requests after a configurable delay; a share of
+them are broken (close the connection) or hung (never answer), picked at
+random but stable per port. Player counts change now and then so the
+controller sees some churn.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import struct
+
+
+def read_varint_from(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+async def read_varint(reader):
+    value = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+        shift += 7
+        if shift > 35:
+            raise ValueError("varint too long")
+
+
+def varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def packet(packet_id, payload):
+    body = varint(packet_id) + payload
+    return varint(len(body)) + body
+
+
+async def read_packet(reader):
+    length = await read_varint(reader)
+    data = await reader.readexactly(length)
+    packet_id, offset = read_varint_from(data, 0)
+    return packet_id, data[offset:]
+
+
+class FakeServer:
+    def __init__(self, port, args, rng):
+        self.port = port
+        self.latency = args.latency / 1000
+        self.jitter = args.jitter / 1000
+        self.churn = args.churn
+        self.max_players = 20
+        self.online = rng.randint(0, self.max_players)
+        roll = rng.random()
+        if roll < args.failure_rate:
+            self.mode = "broken"
+        elif roll < args.failure_rate + args.hang_rate:
+            self.mode = "hung"
+        else:
+            self.mode = "ok"
+
+    def status(self):
+        if random.random() < self.churn:
+            self.online = max(0, min(self.max_players, self.online + random.choice((-1, 1))))
+        return {
+            "version": {"name": "1.21.1", "protocol": 767},
+            "players": {"max": self.max_players, "online": self.online},
+            "description": {"text": f"Benchmark server on {self.port}"},
+        }
+
+    async def handle(self, reader, writer):
+        try:
+            if self.mode == "broken":
+                return
+            packet_id, _ = await read_packet(reader)  # handshake
+            while True:
+                packet_id, payload = await read_packet(reader)
+                if self.mode == "hung":
+                    await asyncio.sleep(3600)
+                await asyncio.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+                if packet_id == 0x00:
+                    data = json.dumps(self.status()).encode()
+                    writer.write(packet(0x00, varint(len(data)) + data))
+                elif packet_id == 0x01:
+                    writer.write(packet(0x01, payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, IndexError, struct.error):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    rng = random.Random(args.seed)
+    servers = [FakeServer(args.base_port + i, args, rng) for i in range(args.count)]
+    for server in servers:
+        await asyncio.start_server(server.handle, args.host, server.port, backlog=64)
+
+    modes = {}
+    for server in servers:
+        modes[server.mode] = modes.get(server.mode, 0) + 1
+    print(f"Emulating {args.count} Minecraft servers on :{args.base_port}+ {modes}", flush=True)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=30000)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=5, help="Mean response delay in ms")
+    parser.add_argument("--jitter", type=float, default=5, help="Delay varies by up to this many ms")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="Share of servers that refuse pings")
+    parser.add_argument("--hang-rate", type=float, default=0.005, help="Share of servers that never answer")
+    parser.add_argument("--churn", type=float, default=0.05, help="Chance the player count changes per ping")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # One listening socket per server, plus the connections being served
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = args.count * 2 + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+Fleet-scale benchmarks for server-controller and api-gateway.
+
+For every fleet size this starts the fake Kubernetes API, the Minecraft
+ping responder, server-controller (with the fake helm on its PATH) and
+api-gateway as local processes, then runs each scenario and records:
+
+- request latency (p50/p99/mean/max)
+- Kubernetes API calls per request, by verb and resource
+- CPU seconds used and RSS of server-controller and api-gateway
+
+Results are written as JSON. Pass --compare with an earlier results file to
+print the change in p50/p99 against it; the exit status is 1 when a p99
+regressed by more than --threshold percent.
+
+    python benchmarks/run.py --sizes 10,100,1000,5000 --output results.json
+    python benchmarks/run.py --compare results.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+NODE_PORT_BASE = 30000
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def http_json(method, url, body=None, timeout=60):
+    data = json.dumps(body).encode() if body is not None else None
+    request = Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urlopen(request, timeout=timeout) as response:
+        return response.status, json.loads(response.read() or b"null")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies):
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else None,
+        "max_ms": round(max(ms), 2) if ms else None,
+    }
+
+
+def process_usage(pid):
+    """CPU seconds (user + system) and current/peak RSS in MB, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    rss = peak = None
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith("VmHWM:"):
+                peak = int(line.split()[1]) / 1024
+    return cpu, rss, peak
+
+
+class Fleet:
+    """The fake cluster, fleet and services under test for one fleet size."""
+
+    def __init__(self, servers, args):
+        self.servers = servers
+        self.args = args
+        self.processes = {}
+        self.tmp = tempfile.mkdtemp(prefix="mcsm-bench-")
+        self.k8s_port = free_port()
+        self.controller_port = free_port()
+        self.gateway_port = free_port()
+        self.k8s_url = f"http://127.0.0.1:{self.k8s_port}"
+        self.controller_url = f"http://127.0.0.1:{self.controller_port}"
+        self.gateway_url = f"http://127.0.0.1:{self.gateway_port}"
+
+    def _spawn(self, name, argv, env=None, cwd=None):
+        log = open(os.path.join(self.tmp, f"{name}.log"), "w")
+        self.processes[name] = (subprocess.Popen(
+            argv, env={**os.environ, **(env or {})}, cwd=cwd, stdout=log, stderr=subprocess.STDOUT
+        ), log)
+
+    def _wait_ready(self, name, url, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            process, log = self.processes[name]
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited, see {log.name}:\n{open(log.name).read()[-2000:]}")
+            try:
+                with urlopen(url, timeout=2):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"{name} did not become ready within {timeout}s")
+
+    def start(self):
+        kubeconfig = os.path.join(self.tmp, "kubeconfig")
+        with open(kubeconfig, "w") as f:
+            json.dump({
+                "apiVersion": "v1", "kind": "Config", "current-context": "bench",
+                "clusters": [{"name": "bench", "cluster": {"server": self.k8s_url}}],
+                "users": [{"name": "bench", "user": {}}],
+                "contexts": [{"name": "bench", "context": {"cluster": "bench", "user": "bench"}}],
+            }, f)
+
+        self._spawn("fake-k8s", [
+            sys.executable, os.path.join(BENCH_DIR, "fake_k8s.py"),
+            "--port", str(self.k8s_port), "--servers", str(self.servers), "--node-port-base", str(NODE_PORT_BASE),
+        ])
+        self._spawn("fake-minecraft", [
+            sys.executable, os.path.join(BENCH_DIR, "fake_minecraft.py"),
+            "--base-port", str(NODE_PORT_BASE), "--count", str(self.servers),
+            "--latency", str(self.args.ping_latency), "--failure-rate", str(self.args.failure_rate),
+            "--hang-rate", str(self.args.hang_rate),
+        ])
+        self._wait_ready("fake-k8s", f"{self.k8s_url}/version", 30)
+
+        started = time.monotonic()
+        self._spawn("server-controller", [sys.executable, "server-controller.py"], cwd=os.path.join(ROOT, "server-controller", "src"), env={
+            "KUBECONFIG": kubeconfig,
+            "PATH": f"{os.path.join(BENCH_DIR, 'bin')}{os.pathsep}{os.environ['PATH']}",
+            "DATA_DIR": os.path.join(self.tmp, "data"),
+            "PORT": str(self.controller_port),
+            "WAKE_LISTENER_PORT": str(free_port()),
+            "MC_QUERY_ADDRESS": "127.0.0.1:{port}",
+            # Big fleets don't fit the real NodePort range; created servers get
+            # ports above the pre-created fleet, which have no responder
+            "NODE_PORT_RANGE": f"{NODE_PORT_BASE}-{min(NODE_PORT_BASE + self.servers + 10000, 65535)}",
+            "PYTHONUNBUFFERED": "1",
+        })
+        self._spawn("api-gateway", [sys.executable, "api-gateway.py"], cwd=os.path.join(ROOT, "api-gateway", "src"), env={
+            "SERVER_CONTROLLER_URL": self.controller_url,
+            "PORT": str(self.gateway_port),
+            "PYTHONUNBUFFERED": "1",
+        })
+        self._wait_ready("server-controller", f"{self.controller_url}/", 120)
+        self.startup_seconds = time.monotonic() - started
+        self._wait_ready("api-gateway", f"{self.gateway_url}/", 30)
+
+    def stop(self):
+        for process, log in self.processes.values():
+            process.terminate()
+        for process, log in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+        if self.args.keep_logs:
+            print(f"  logs kept in {self.tmp}")
+        else:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def pid(self, name):
+        return self.processes[name][0].pid
+
+    def api_calls(self, reset=False):
+        status, stats = http_json("POST" if reset else "GET", f"{self.k8s_url}/_bench/{'reset' if reset else 'stats'}")
+        return stats
+
+    def measure(self, name, run, requests):
+        """Run a scenario and collect latency, API calls and resource usage for it."""
+        self.api_calls(reset=True)
+        before = {proc: process_usage(self.pid(proc)) for proc in ("server-controller", "api-gateway")}
+        started = time.monotonic()
+        latencies, errors, extra = run()
+        elapsed = time.monotonic() - started
+        after = {proc: process_usage(self.pid(proc)) for proc in ("server-controller", "api-gateway")}
+        calls = self.api_calls()
+
+        result = {
+            "requests": requests,
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            **summarize(latencies),
+            "api_calls_per_request": round(calls["total"] / requests, 2) if requests else None,
+            "api_calls": calls["calls"],
+            "cpu_s": {proc: round(after[proc][0] - before[proc][0], 3) for proc in after},
+            "rss_mb": {proc: round(after[proc][1], 1) for proc in after},
+            "peak_rss_mb": {proc: round(after[proc][2], 1) for proc in after},
+            **extra,
+        }
+        latency = f"p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms  " if latencies else ""
+        cpu = "  ".join(f"{proc} {result['cpu_s'][proc]}s cpu" for proc in after)
+        print(f"  {name:<14} {latency}api/req {result['api_calls_per_request']}  {cpu}  errors {errors}")
+        return result
+
+
+def timed_requests(count, concurrency, call):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            call(i)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(count)))
+    return latencies, errors
+
+
+def read_first_snapshot(base_url, path, timeout=60):
+    """Open the status stream and return once the initial snapshot event has arrived."""
+    host, port = base_url.split("//", 1)[1].split(":")
+    connection = http.client.HTTPConnection(host, int(port), timeout=timeout)
+    try:
+        connection.request("GET", path, headers={"Accept": "text/event-stream"})
+        response = connection.getresponse()
+        event = None
+        while True:
+            line = response.fp.readline()
+            if not line:
+                raise RuntimeError("stream closed before the snapshot")
+            line = line.decode().rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line == "" and event == "snapshot":
+                return
+    finally:
+        connection.close()
+
+
+def scenario_list(fleet, args):
+    def call(i):
+        status, body = http_json("GET", f"{fleet.controller_url}/list?limit={args.list_limit}")
+        if status != 200:
+            raise RuntimeError(status)
+
+    return fleet.measure("list", lambda: (*timed_requests(args.requests, args.concurrency, call), {}), args.requests)
+
+
+def scenario_status_stream(fleet, args):
+    def call(i):
+        read_first_snapshot(fleet.gateway_url, "/servers/status/all")
+
+    count = max(1, args.requests // 4)
+    return fleet.measure(
+        "status_stream", lambda: (*timed_requests(count, args.concurrency, call), {}), count
+    )
+
+
+def scenario_status_idle(fleet, args):
+    # Many dashboards left open: steady-state cost of the status sweep and fan-out
+    def run():
+        stop = threading.Event()
+        received = []
+
+        def subscriber():
+            host, port = fleet.gateway_url.split("//", 1)[1].split(":")
+            connection = http.client.HTTPConnection(host, int(port), timeout=args.idle_seconds + 30)
+            count = 0
+            try:
+                connection.request("GET", "/servers/status/all")
+                response = connection.getresponse()
+                while not stop.is_set():
+                    line = response.fp.readline()
+                    if not line:
+                        break
+                    if line.startswith(b"event:"):
+                        count += 1
+            except OSError:
+                pass
+            finally:
+                received.append(count)
+                connection.close()
+
+        threads = [threading.Thread(target=subscriber, daemon=True) for _ in range(args.subscribers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.idle_seconds)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        return [], 0, {"subscribers": args.subscribers, "seconds": args.idle_seconds, "events": sum(received)}
+
+    return fleet.measure("status_idle", run, args.subscribers)
+
+
+def scenario_create(fleet, args):
+    # Latency is until the create is accepted (202); job_* is until the release is applied
+    accept_latencies, job_latencies = [], []
+    lock = threading.Lock()
+
+    def call(i):
+        started = time.perf_counter()
+        status, body = http_json("POST", f"{fleet.gateway_url}/servers/create", {
+            "minecraftServer": {"type": "VANILLA", "version": "LATEST", "motd": f"bench {i}"},
+        })
+        if status != 202:
+            raise RuntimeError(status)
+        with lock:
+            accept_latencies.append(time.perf_counter() - started)
+        # Follow the job until the release is applied
+        while True:
+            status, job = http_json("GET", f"{fleet.controller_url}/jobs/{body['job_id']}")
+            if job["status"] not in ("pending", "running"):
+                break
+            time.sleep(0.05)
+        if job["status"] != "succeeded":
+            raise RuntimeError(job)
+        with lock:
+            job_latencies.append(time.perf_counter() - started)
+
+    def run():
+        _, errors = timed_requests(args.creates, args.concurrency, call)
+        job = summarize(job_latencies)
+        return accept_latencies, errors, {"job_" + key: value for key, value in job.items()}
+
+    return fleet.measure("create", run, args.creates)
+
+
+SCENARIOS = {
+    "list": scenario_list,
+    "status_stream": scenario_status_stream,
+    "status_idle": scenario_status_idle,
+    "create": scenario_create,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print p50/p99 changes against a baseline run; returns True if any p99 regressed past the threshold."""
+    base_runs = {run["servers"]: run for run in baseline["runs"]}
+    regressed = False
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('time')}):")
+    for run in results["runs"]:
+        base_run = base_runs.get(run["servers"])
+        if base_run is None:
+            continue
+        for name, scenario in run["scenarios"].items():
+            base = base_run["scenarios"].get(name)
+            if base is None:
+                continue
+            changes = []
+            for key in ("p50_ms", "p99_ms", "api_calls_per_request"):
+                if scenario.get(key) is None or not base.get(key):
+                    continue
+                change = (scenario[key] - base[key]) / base[key] * 100
+                changes.append(f"{key} {base[key]} -> {scenario[key]} ({change:+.1f}%)")
+                if key == "p99_ms" and change > threshold:
+                    regressed = True
+                    changes[-1] += " REGRESSED"
+            print(f"  {run['servers']:>5} {name:<16} {'  '.join(changes)}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="Comma-separated fleet sizes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per latency scenario")
+    parser.add_argument("--creates", type=int, default=50, help="Servers created in the create scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--list-limit", type=int, default=100, help="Page size for /list")
+    parser.add_argument("--subscribers", type=int, default=50, help="Open streams in status_idle")
+    parser.add_argument("--idle-seconds", type=int, default=15, help="How long status_idle runs")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds to let the first status sweeps settle")
+    parser.add_argument("--ping-latency", type=float, default=5, help="Mean Minecraft ping delay in ms")
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--hang-rate", type=float, default=0.005)
+    parser.add_argument("--output", default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=20, help="p99 regression (%%) that fails --compare")
+    parser.add_argument("--keep-logs", action="store_true", help="Keep the process logs of every run")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = [name.strip() for name in args.scenarios.split(",")]
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+
+    for servers in sizes:
+        print(f"{servers} servers")
+        fleet = Fleet(servers, args)
+        try:
+            fleet.start()
+            time.sleep(args.warmup)
+            run = {
+                "servers": servers,
+                "startup_s": round(fleet.startup_seconds, 2),
+                "scenarios": {name: SCENARIOS[name](fleet, args) for name in scenarios},
+            }
+            results["runs"].append(run)
+        finally:
+            fleet.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import gzip
+
+import brotli
+from quart import request
+from quart.wrappers.response import DataBody
+
+# Preferred first
+ENCODINGS = ("br", "gzip")
+# Bodies smaller than this aren't worth the CPU
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html")
+
+
+def negotiate_encoding(accept_encodings):
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        # Quality 11 (the default) is far too slow for per-request use
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+# A strong ETag has to differ between the plain and the compressed body, so the
+# encoding is appended to it ("v1" -> "v1-br"). When comparing, any variant of
+# the same version counts as a match.
+def encoded_etag(etag, encoding):
+    return f"{etag}-{encoding}"
+
+
+def strip_encoding(etag):
+    for encoding in ENCODINGS:
+        if etag.endswith(f"-{encoding}"):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+# Function to check a request's If-None-Match against the current version.
+# Returns the tag the client sent, to echo back in the 304, or None.
+def matching_etag(etag, if_none_match):
+    for tag in if_none_match.as_set(include_weak=True):
+        if strip_encoding(tag) == etag:
+            return tag
+    return None
+
+
+def compress_responses(app):
+    """Compress JSON and text responses for clients that accept br or gzip."""
+
+    @app.after_request
+    async def compress_response(response):
+        # Streams (status events, bulk results) are relayed chunk by chunk as they are
+        if (
+            response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or not isinstance(response.response, DataBody)
+            or response.mimetype not in COMPRESSIBLE_TYPES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = await response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak)
+        return response
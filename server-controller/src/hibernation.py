@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+from collections import deque
+
+IDLE_TIMEOUT_ANNOTATION = "mc-server-manager/idle-timeout"
+HIBERNATED_ANNOTATION = "mc-server-manager/hibernated-selector"
+
+
+class AuditLog:
+    """Hibernate/wake events, kept in memory and appended to a JSON lines file."""
+
+    def __init__(self, path=None, max_events=1000):
+        self.path = path
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.exists(path):
+                with open(path) as f:
+                    for line in deque(f, maxlen=max_events):
+                        try:
+                            self.events.append(json.loads(line))
+                        except ValueError:
+                            pass
+
+    def record(self, server_id, event, reason, **details):
+        entry = {"time": time.time(), "server_id": server_id, "event": event, "reason": reason, **details}
+        print(f"{event} {server_id}: {reason}")
+        with self._lock:
+            self.events.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, "a") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    print(f"Error writing audit log: {e}")
+        return entry
+
+    def recent(self, limit=100, server_id=None):
+        with self._lock:
+            events = [e for e in self.events if server_id is None or e["server_id"] == server_id]
+        return events[-limit:]
+
+
+class HibernationPolicy:
+    """
+    Scales servers to zero once nobody has been online for a while.
+
+    `observe` is fed every status sweep. A running server that answers pings
+    with no players online starts an idle timer; players joining or the server
+    stopping resets it. When the timer passes the server's idle timeout (the
+    default, or the `mc-server-manager/idle-timeout` annotation on its
+    Deployment, where 0 disables hibernation) `hibernate(server_id)` is called.
+    """
+
+    def __init__(self, server_cache, hibernate, default_idle_timeout=1800):
+        self.server_cache = server_cache
+        self.hibernate = hibernate
+        self.default_idle_timeout = default_idle_timeout
+
+        self.idle_since = {}
+        self._hibernating = set()
+
+    def idle_timeout(self, deployment_name):
+        deployment = self.server_cache.get_deployment(deployment_name)
+        annotations = (deployment.metadata.annotations or {}) if deployment is not None else {}
+        try:
+            return int(annotations[IDLE_TIMEOUT_ANNOTATION])
+        except (KeyError, ValueError):
+            return self.default_idle_timeout
+
+    def observe(self, servers, now=None):
+        now = time.monotonic() if now is None else now
+        seen = set()
+
+        for server in servers:
+            name = server["name"]
+            seen.add(name)
+
+            if server.get("status") != "Running":
+                self.idle_since.pop(name, None)
+                self._hibernating.discard(name)
+                continue
+
+            players = server.get("players")
+            if not isinstance(players, dict):
+                # No answer to the ping (still booting, or broken); don't count it as idle
+                continue
+            if players.get("online", 0) > 0:
+                self.idle_since.pop(name, None)
+                continue
+
+            idle_since = self.idle_since.setdefault(name, now)
+            timeout = self.idle_timeout(name)
+            if timeout <= 0 or name in self._hibernating:
+                continue
+            if now - idle_since >= timeout:
+                self._hibernating.add(name)
+                self.hibernate(server["server_id"], idle_for=round(now - idle_since))
+
+        for name in list(self.idle_since):
+            if name not in seen:
+                del self.idle_since[name]
+        self._hibernating &= seen
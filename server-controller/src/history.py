@@ -0,0 +1,166 @@
+import os
+import pickle
+import threading
+import time
+
+from array import array
+
+# (resolution in seconds, number of slots): 1 hour at 5s, 1 day at 1m, 1 week at 15m
+DEFAULT_TIERS = [(5, 720), (60, 1440), (900, 672)]
+
+
+class RingBuffer:
+    """
+    Fixed-size, array-backed series of samples at one resolution.
+
+    Slot `i` holds the bucket `bucket % size`, so memory never grows; a slot
+    is reset when a newer bucket lands on it. Samples that fall in the same
+    bucket are aggregated (averages for players and latency, uptime fraction).
+    """
+
+    def __init__(self, resolution, size):
+        self.resolution = resolution
+        self.size = size
+        self.buckets = array("q", [-1]) * size
+        self.samples = array("H", [0]) * size
+        self.up_samples = array("H", [0]) * size
+        self.players_sum = array("f", [0]) * size
+        self.latency_sum = array("f", [0]) * size
+
+    def add(self, timestamp, players, latency, up):
+        bucket = int(timestamp // self.resolution)
+        i = bucket % self.size
+        if self.buckets[i] != bucket:
+            self.buckets[i] = bucket
+            self.samples[i] = self.up_samples[i] = 0
+            self.players_sum[i] = self.latency_sum[i] = 0
+
+        if self.samples[i] == 0xFFFF:
+            return
+        self.samples[i] += 1
+        self.players_sum[i] += players
+        if up:
+            self.up_samples[i] += 1
+            self.latency_sum[i] += latency or 0
+
+    def span(self):
+        return self.resolution * self.size
+
+    def points(self, start, end):
+        first = int(start // self.resolution)
+        last = int(end // self.resolution)
+        first = max(first, last - self.size + 1)
+
+        points = []
+        for bucket in range(first, last + 1):
+            i = bucket % self.size
+            if self.buckets[i] != bucket or self.samples[i] == 0:
+                continue
+            samples, up_samples = self.samples[i], self.up_samples[i]
+            points.append({
+                "time": bucket * self.resolution,
+                "players": round(self.players_sum[i] / samples, 2),
+                "latency": round(self.latency_sum[i] / up_samples, 1) if up_samples else None,
+                "up": round(up_samples / samples, 3),
+            })
+        return points
+
+
+class ServerHistory:
+    def __init__(self, tiers):
+        self.tiers = [RingBuffer(resolution, size) for resolution, size in tiers]
+
+    def add(self, timestamp, players, latency, up):
+        # Every tier aggregates the sample into its own bucket, so the coarser
+        # tiers are downsampled as samples come in
+        for tier in self.tiers:
+            tier.add(timestamp, players, latency, up)
+
+
+class HistoryStore:
+    """
+    Per-server status history: players online, ping latency and up/down.
+
+    Each server gets one ring buffer per tier, so memory per server is fixed.
+    `record` takes one sample per server per finest-tier interval. The store
+    is periodically pickled to `path` and reloaded on start-up.
+    """
+
+    def __init__(self, path=None, tiers=DEFAULT_TIERS, snapshot_interval=60):
+        self.path = path
+        self.tiers = tiers
+        self.snapshot_interval = snapshot_interval
+
+        self._servers = {}
+        self._last_bucket = None
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    snapshot = pickle.load(f)
+                if snapshot["tiers"] == tiers:
+                    self._servers = snapshot["servers"]
+            except Exception as e:
+                print(f"Error loading status history: {e}")
+
+    def start(self):
+        if self.path:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def record(self, servers, now=None):
+        """Record a sample for every server, at most once per finest-tier bucket."""
+        now = time.time() if now is None else now
+        bucket = int(now // self.tiers[0][0])
+        if bucket == self._last_bucket:
+            return
+        self._last_bucket = bucket
+
+        with self._lock:
+            for server in servers:
+                history = self._servers.get(server["server_id"])
+                if history is None:
+                    history = self._servers[server["server_id"]] = ServerHistory(self.tiers)
+                players = server.get("players")
+                up = server.get("status") == "Running" and isinstance(players, dict)
+                history.add(now, players.get("online", 0) if up else 0, server.get("latency"), up)
+
+    def forget(self, server_id):
+        with self._lock:
+            self._servers.pop(server_id, None)
+
+    def query(self, server_id, window, resolution=None, now=None):
+        """
+        Points for the last `window` seconds, from the finest tier that covers
+        the whole window (or the tier with the given resolution).
+        Returns None for an unknown server.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            history = self._servers.get(server_id)
+            if history is None:
+                return None
+
+            tiers = history.tiers
+            if resolution is not None:
+                tiers = [tier for tier in tiers if tier.resolution == resolution] or tiers
+            tier = next((tier for tier in tiers if tier.span() >= window), tiers[-1])
+            return tier.resolution, tier.points(now - window, now)
+
+    def snapshot(self):
+        with self._lock:
+            data = pickle.dumps({"tiers": self.tiers, "servers": self._servers})
+        # Write to a temporary file first so a crash never leaves a torn snapshot
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(f"Error saving status history: {e}")
@@ -0,0 +1,178 @@
+import queue
+import threading
+import time
+
+from collections import OrderedDict
+from uuid import uuid4
+
+from metrics import JOB_DURATION
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, server_id, action, func, on_superseded=None):
+        self.id = str(uuid4())
+        self.server_id = server_id
+        self.action = action
+        self.func = func
+        # Called instead of func when the job never runs, to undo what was set up for it
+        self.on_superseded = on_superseded
+
+        self.status = "pending"
+        self.output = None
+        self.superseded_by = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def finish(self, status, output=None):
+        self.status = status
+        self.output = output
+        self.finished_at = time.time()
+        with self._callbacks_lock:
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        if status == "superseded" and self.on_superseded is not None:
+            try:
+                self.on_superseded()
+            except Exception as e:
+                print(f"Error cleaning up superseded job {self.id}: {e}")
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Call `callback(job)` once the job finishes (straight away if it already has)."""
+        with self._callbacks_lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "server_id": self.server_id,
+            "action": self.action,
+            "status": self.status,
+            "output": self.output,
+            "superseded_by": self.superseded_by,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Runs server lifecycle operations on a bounded pool of worker threads.
+
+    Operations on the same server run one at a time, in order. Each server has
+    at most one pending job besides its create: a new job for a server
+    replaces the one still waiting (a start, stop, start burst only runs the
+    last start), except that a pending delete is never replaced and a pending
+    create is never replaced either; later jobs wait behind it. A replaced job
+    finishes as "superseded" and its `on_superseded` hook is called. Jobs are
+    kept for `max_history` submissions so their status can be looked up
+    afterwards.
+    """
+
+    def __init__(self, workers=4, max_pending=1000, max_history=5000):
+        self.max_pending = max_pending
+        self.max_history = max_history
+
+        self.jobs = OrderedDict()
+        # server_id -> its pending jobs, in the order they'll run
+        self._pending = {}
+        self._running = set()
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def depth(self):
+        with self._lock:
+            return sum(len(jobs) for jobs in self._pending.values())
+
+    def submit(self, server_id, action, func, on_superseded=None):
+        job = Job(server_id, action, func, on_superseded)
+
+        with self._lock:
+            jobs = self._pending.get(server_id)
+            last = jobs[-1] if jobs else None
+            if last is not None and last.action == "delete":
+                # The server is about to go away, nothing else is worth running
+                job.superseded_by = last.id
+                self._remember(job)
+                job.finish("superseded")
+                return job
+
+            if jobs is None and len(self._pending) >= self.max_pending:
+                raise QueueFullError("Too many pending operations")
+
+            self._remember(job)
+            if jobs is None:
+                self._pending[server_id] = [job]
+                if server_id not in self._running:
+                    self._ready.put(server_id)
+            elif last.action == "create":
+                # Whatever follows a create needs the server it creates
+                jobs.append(job)
+            else:
+                jobs[-1] = job
+                last.superseded_by = job.id
+                last.finish("superseded")
+
+        return job
+
+    def _remember(self, job):
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_history:
+            self.jobs.popitem(last=False)
+
+    def _work(self):
+        while True:
+            server_id = self._ready.get()
+            with self._lock:
+                jobs = self._pending.get(server_id)
+                if not jobs:
+                    continue
+                job = jobs.pop(0)
+                if not jobs:
+                    del self._pending[server_id]
+                self._running.add(server_id)
+
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                output = job.func()
+                job.finish("failed" if "Error" in output else "succeeded", output)
+            except Exception as e:
+                job.finish("failed", f"Error: {e}")
+            JOB_DURATION.labels(job.action, job.status).observe(job.finished_at - job.started_at)
+
+            with self._lock:
+                self._running.discard(server_id)
+                # Anything submitted for this server while it ran goes next
+                if server_id in self._pending:
+                    self._ready.put(server_id)
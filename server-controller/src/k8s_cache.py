@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+
+from kubernetes import client, watch
+
+from metrics import K8S_API_DURATION, K8S_WATCH_EVENTS
+
+# Objects per list call; big lists are fetched in chunks so neither side has
+# to hold one huge response
+DEFAULT_PAGE_SIZE = 500
+
+
+def list_paged(list_func, namespace="default", page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """
+    List a resource in chunks of `page_size` using limit/continue. Returns the
+    items and the resourceVersion the list is consistent with. A namespace of
+    None is for the cluster-wide list functions (`list_*_for_all_namespaces`).
+    """
+    if namespace is not None:
+        kwargs["namespace"] = namespace
+    items = []
+    _continue = None
+    while True:
+        with K8S_API_DURATION.labels("list").time():
+            result = list_func(limit=page_size, _continue=_continue, **kwargs)
+        items.extend(result.items)
+        _continue = result.metadata._continue
+        if not _continue:
+            return items, result.metadata.resource_version
+
+
+class ResourceInformer:
+    """
+    Keeps an in-memory copy of one namespaced resource kind (e.g. Deployments),
+    kept current by a Kubernetes watch.
+
+    The informer lists the resource once to get a starting resourceVersion, then
+    watches from that version. When the watch times out it resumes from the last
+    resourceVersion it saw; when the API server answers 410 Gone (the version is
+    too old) or the watch fails it falls back to a full relist. Listeners hear
+    about whatever changed between the two as synthetic ADDED, MODIFIED and
+    DELETED events, so they never miss a change made while the watch was down.
+    With a `label_selector` both the list and the watch are filtered by the API
+    server, so only matching objects are ever sent or stored. With a namespace
+    of None, `list_func` must be a cluster-wide list function and objects are
+    keyed by "namespace/name".
+    """
+
+    def __init__(self, list_func, namespace="default", label_selector=None, page_size=DEFAULT_PAGE_SIZE,
+                 watch_timeout=300, retry_delay=5):
+        self.list_func = list_func
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.page_size = page_size
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+
+        self.resource_version = None
+        # Counts changes to the store, so readers can tell cheaply whether anything moved
+        self.version = 0
+        self._listeners = []
+        self._store = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def add_listener(self, listener):
+        """
+        Call `listener(event_type, obj)` for every watch event, and for every
+        difference a relist finds, after the cache is updated.
+        """
+        self._listeners.append(listener)
+
+    def wait_for_sync(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def get(self, name):
+        with self._lock:
+            return self._store.get(name)
+
+    def items(self):
+        with self._lock:
+            return list(self._store.values())
+
+    def _key(self, obj):
+        if self.namespace is None:
+            return f"{obj.metadata.namespace}/{obj.metadata.name}"
+        return obj.metadata.name
+
+    def _relist(self):
+        items, resource_version = list_paged(
+            self.list_func, self.namespace, self.page_size, label_selector=self.label_selector
+        )
+        store = {self._key(item): item for item in items}
+        with self._lock:
+            previous = self._store
+            self._store = store
+            self.resource_version = resource_version
+            self.version += 1
+        self._synced.set()
+
+        # Replay what happened while nothing was watching
+        for key, obj in previous.items():
+            if key not in store:
+                self._notify("DELETED", obj)
+        for key, obj in store.items():
+            if key not in previous:
+                self._notify("ADDED", obj)
+            elif previous[key].metadata.resource_version != obj.metadata.resource_version:
+                self._notify("MODIFIED", obj)
+
+    def _notify(self, event_type, obj):
+        for listener in self._listeners:
+            try:
+                listener(event_type, obj)
+            except Exception as e:
+                print(f"Error in {self.list_func.__name__} listener: {e}")
+
+    def _apply_event(self, event):
+        event_type = event["type"]
+        obj = event["object"]
+        K8S_WATCH_EVENTS.labels(self.list_func.__name__, event_type).inc()
+
+        if event_type == "BOOKMARK":
+            self.resource_version = event["raw_object"]["metadata"]["resourceVersion"]
+            return
+
+        with self._lock:
+            if event_type == "DELETED":
+                self._store.pop(self._key(obj), None)
+            else:
+                self._store[self._key(obj)] = obj
+            self.resource_version = obj.metadata.resource_version
+            self.version += 1
+
+        self._notify(event_type, obj)
+
+    def _watch(self):
+        w = watch.Watch()
+        kwargs = {} if self.namespace is None else {"namespace": self.namespace}
+        for event in w.stream(
+            self.list_func,
+            **kwargs,
+            label_selector=self.label_selector,
+            resource_version=self.resource_version,
+            timeout_seconds=self.watch_timeout,
+            allow_watch_bookmarks=True,
+        ):
+            if self._stop.is_set():
+                w.stop()
+                return
+            self._apply_event(event)
+
+    def _run(self):
+        needs_relist = True
+        while not self._stop.is_set():
+            try:
+                if needs_relist:
+                    self._relist()
+                    needs_relist = False
+                # Returns when the server-side watch timeout expires; resume from
+                # the last resourceVersion seen
+                self._watch()
+            except client.exceptions.ApiException as e:
+                if e.status == 410:
+                    print(f"Watch on {self.list_func.__name__} expired, relisting")
+                else:
+                    print(f"Error watching {self.list_func.__name__}: {e}")
+                    time.sleep(self.retry_delay)
+                needs_relist = True
+            except Exception as e:
+                print(f"Error watching {self.list_func.__name__}: {e}")
+                time.sleep(self.retry_delay)
+                needs_relist = True
+
+
+class ServerCache:
+    """
+    Watch-backed cache of the Deployments and Services that make up the
+    Minecraft servers, so listing servers doesn't need any API calls. Only
+    objects matching `label_selector` are cached.
+    """
+
+    def __init__(self, k8s_core_v1, k8s_apps_v1, namespace="default", label_selector=None):
+        self.deployments = ResourceInformer(k8s_apps_v1.list_namespaced_deployment, namespace, label_selector)
+        self.services = ResourceInformer(k8s_core_v1.list_namespaced_service, namespace, label_selector)
+        # Versions restart at 0 with the process; this keeps them from repeating across restarts
+        self._epoch = os.urandom(4).hex()
+
+    def start(self):
+        self.deployments.start()
+        self.services.start()
+
+    def wait_for_sync(self, timeout=None):
+        return self.deployments.wait_for_sync(timeout) and self.services.wait_for_sync(timeout)
+
+    def has_synced(self):
+        return self.deployments.has_synced() and self.services.has_synced()
+
+    def get_deployment(self, name):
+        return self.deployments.get(name)
+
+    def get_service(self, name):
+        return self.services.get(name)
+
+    def list_deployments(self):
+        return self.deployments.items()
+
+    @property
+    def version(self):
+        """Changes whenever any cached Deployment or Service does."""
+        return f"{self._epoch}.{self.deployments.version}.{self.services.version}"
@@ -0,0 +1,53 @@
+import time
+
+from quart import g, request
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ["method", "endpoint", "status"]
+)
+HELM_DURATION = Histogram(
+    "helm_command_duration_seconds", "Time spent in helm subprocesses", ["command"]
+)
+K8S_API_DURATION = Histogram(
+    "k8s_api_duration_seconds", "Time spent in Kubernetes API calls", ["operation"]
+)
+K8S_WATCH_EVENTS = Counter(
+    "k8s_watch_events_total", "Kubernetes watch events received", ["resource", "type"]
+)
+MC_PING_DURATION = Histogram(
+    "mc_ping_duration_seconds", "Minecraft server status ping time", ["result"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+STATUS_SWEEP_DURATION = Histogram(
+    "status_sweep_duration_seconds", "Time spent collecting one fleet status sweep"
+)
+JOB_DURATION = Histogram(
+    "job_duration_seconds", "Time spent running lifecycle jobs", ["action", "status"]
+)
+TEMPLATE_VALUES_LOOKUPS = Counter(
+    "template_values_lookups_total", "Compiled template lookups (hit, revalidated, compiled)", ["result"]
+)
+TEMPLATE_COMPILES = Histogram("template_compile_duration_seconds", "Time spent compiling a template into chart values")
+SSE_SUBSCRIBERS = Gauge("sse_subscribers", "Connected /status/all clients")
+FLEET_SIZE = Gauge("fleet_servers", "Minecraft servers managed by the controller")
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Lifecycle jobs waiting to run")
+
+
+def track_requests(app):
+    """Record the latency of every request, labelled by route rather than raw path."""
+
+    # Async hooks run on the event loop; sync ones would each take a thread hop
+    @app.before_request
+    async def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    async def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_REQUEST_DURATION.labels(request.method, endpoint, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
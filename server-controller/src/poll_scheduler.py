@@ -0,0 +1,77 @@
+import random
+import threading
+import time
+
+
+class PollScheduler:
+    """
+    Decides which servers to ping on each status sweep.
+
+    Every server has its own polling interval. It starts at `fast_interval`
+    and stays there while the server's online state or player count keeps
+    changing; while nothing changes it doubles on every poll up to
+    `max_interval`. Each interval gets some random jitter so servers don't
+    fall into lockstep. `mark` resets a server to be polled on the next sweep,
+    e.g. when a watch event shows its Deployment changed.
+
+    Servers that aren't running aren't pinged at all; their state comes from
+    the Deployment watch.
+    """
+
+    def __init__(self, poll, fast_interval=2, max_interval=60, jitter=0.2):
+        self.poll = poll
+        self.fast_interval = fast_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        with self._lock:
+            state = self._state.get(name)
+            if state is not None:
+                state["next_due"] = 0
+                state["interval"] = self.fast_interval
+
+    def _schedule(self, state, now):
+        spread = state["interval"] * self.jitter
+        state["next_due"] = now + state["interval"] + random.uniform(-spread, spread)
+
+    @staticmethod
+    def _fingerprint(result):
+        players = (result.get("raw") or {}).get("players") or {}
+        return (result["online"], result["error"] is None, players.get("online"))
+
+    def collect(self, targets, now=None):
+        """
+        Ping the servers in `targets` (name -> (host, port)) that are due, and
+        return the latest result for every one of them.
+        """
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            for name in list(self._state):
+                if name not in targets:
+                    del self._state[name]
+            due = {
+                name: address
+                for name, address in targets.items()
+                if name not in self._state or self._state[name]["next_due"] <= now
+            }
+
+        fresh = self.poll(due)
+
+        with self._lock:
+            for name, result in fresh.items():
+                state = self._state.get(name)
+                if state is None:
+                    state = self._state[name] = {"interval": self.fast_interval, "result": None}
+                elif self._fingerprint(result) != self._fingerprint(state["result"]):
+                    state["interval"] = self.fast_interval
+                else:
+                    state["interval"] = min(state["interval"] * 2, self.max_interval)
+                state["result"] = result
+                self._schedule(state, now)
+
+            return {name: self._state[name]["result"] for name in targets if name in self._state}
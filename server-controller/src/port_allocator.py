@@ -0,0 +1,213 @@
+import threading
+import time
+
+from collections import deque
+
+# Range Kubernetes hands NodePorts out of by default (--service-node-port-range)
+DEFAULT_PORT_RANGE = (30000, 32767)
+# How long a reserved port is held for an install that hasn't created its Service yet
+DEFAULT_RESERVATION_TTL = 300
+REUSE_POLICIES = ("fifo", "lifo")
+
+
+class PortAllocationError(Exception):
+    pass
+
+
+def parse_port_range(spec):
+    """Parses "30000-32767" into (30000, 32767)."""
+    start, _, end = spec.partition("-")
+    start, end = int(start), int(end or start)
+    if start > end:
+        raise ValueError(f"invalid port range {spec}")
+    return start, end
+
+
+class Bitmap:
+    def __init__(self, size):
+        self.bits = bytearray((size + 7) // 8)
+
+    def __getitem__(self, i):
+        return self.bits[i >> 3] >> (i & 7) & 1
+
+    def __setitem__(self, i, value):
+        if value:
+            self.bits[i >> 3] |= 1 << (i & 7)
+        else:
+            self.bits[i >> 3] &= ~(1 << (i & 7))
+
+
+class PortAllocator:
+    """
+    Hands out free NodePorts for new servers.
+
+    A bitmap indexed by port marks every port that is taken, either by an
+    existing Service (fed by `on_service_event` from an informer on all
+    Services in the cluster, since NodePorts are cluster-wide; its initial
+    list and relists arrive as events too) or by a reservation. Free ports
+    sit in a queue, so `reserve` is O(1): it pops ports until it finds one
+    that isn't taken.
+
+    A reservation holds a port until the server's Service shows up in the
+    watch, it is released, or it expires after `reservation_ttl` seconds.
+
+    Ports freed by a deleted Service go back into the queue after
+    `reuse_delay` seconds, at the back ("fifo", so they're reused last) or the
+    front ("lifo", reused first).
+    """
+
+    def __init__(self, port_range=DEFAULT_PORT_RANGE, reuse="fifo", reuse_delay=0,
+                 reservation_ttl=DEFAULT_RESERVATION_TTL):
+        if reuse not in REUSE_POLICIES:
+            raise ValueError(f"reuse policy must be one of {', '.join(REUSE_POLICIES)}")
+        self.start, self.end = port_range
+        self.reuse = reuse
+        self.reuse_delay = reuse_delay
+        self.reservation_ttl = reservation_ttl
+
+        size = self.end - self.start + 1
+        self._taken = Bitmap(size)
+        # Marks the ports in `_free`, so a port is never queued twice
+        self._queued = Bitmap(size)
+        self._free = deque()
+        # Freed ports waiting out the reuse delay, in the order they were freed
+        self._cooldown = deque()
+        # port -> expiry, and the same in expiry order (the TTL is fixed)
+        self._reservations = {}
+        self._expiries = deque()
+        # Service key -> NodePorts it uses, and NodePort -> number of Services using it
+        self._service_ports = {}
+        self._port_users = {}
+        self._lock = threading.Lock()
+
+        for port in range(self.start, self.end + 1):
+            self._enqueue(port)
+
+    def _index(self, port):
+        return port - self.start
+
+    def _in_range(self, port):
+        return self.start <= port <= self.end
+
+    def _enqueue(self, port, front=False):
+        i = self._index(port)
+        if self._queued[i]:
+            return
+        self._queued[i] = 1
+        if front:
+            self._free.appendleft(port)
+        else:
+            self._free.append(port)
+
+    def _free_port(self, port, now):
+        self._taken[self._index(port)] = 0
+        if self.reuse_delay > 0:
+            self._cooldown.append((now + self.reuse_delay, port))
+        else:
+            self._enqueue(port, front=self.reuse == "lifo")
+
+    def _expire(self, now):
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, port = self._expiries.popleft()
+            # Skip entries for reservations that were confirmed, released or renewed
+            if self._reservations.get(port) != expiry:
+                continue
+            del self._reservations[port]
+            if port not in self._port_users:
+                print(f"Reservation for NodePort {port} expired")
+                self._unhold(port)
+
+        while self._cooldown and self._cooldown[0][0] <= now:
+            ready_at, port = self._cooldown.popleft()
+            if not self._taken[self._index(port)]:
+                self._enqueue(port, front=self.reuse == "lifo")
+
+    def _hold(self, port, now):
+        self._taken[self._index(port)] = 1
+        expiry = now + self.reservation_ttl
+        self._reservations[port] = expiry
+        self._expiries.append((expiry, port))
+
+    def _unhold(self, port):
+        # Never handed to a Service, so it can go straight back to the front
+        self._taken[self._index(port)] = 0
+        self._enqueue(port, front=True)
+
+    def reserve(self, now=None):
+        """Reserve any free port."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            while self._free:
+                port = self._free.popleft()
+                self._queued[self._index(port)] = 0
+                if not self._taken[self._index(port)]:
+                    self._hold(port, now)
+                    return port
+        raise PortAllocationError(f"no free NodePorts left in {self.start}-{self.end}")
+
+    def reserve_port(self, port, now=None):
+        """Reserve a specific port, e.g. one the user asked for."""
+        now = time.monotonic() if now is None else now
+        if not self._in_range(port):
+            raise PortAllocationError(f"NodePort {port} is outside the range {self.start}-{self.end}")
+        with self._lock:
+            self._expire(now)
+            if self._taken[self._index(port)]:
+                raise PortAllocationError(f"NodePort {port} is already in use")
+            # Left in the free queue; reserve() skips it while it's taken
+            self._hold(port, now)
+        return port
+
+    def release(self, port, now=None):
+        """Give back a reserved port whose server was never created."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._reservations.pop(port, None) is not None and port not in self._port_users:
+                self._unhold(port)
+
+    def _set_service_ports(self, key, ports, now):
+        ports = {port for port in ports if self._in_range(port)}
+        previous = self._service_ports.pop(key, set())
+        if ports:
+            self._service_ports[key] = ports
+
+        for port in ports - previous:
+            self._port_users[port] = self._port_users.get(port, 0) + 1
+            self._taken[self._index(port)] = 1
+            # The Service exists now, so the reservation has done its job
+            self._reservations.pop(port, None)
+
+        for port in previous - ports:
+            self._port_users[port] -= 1
+            if self._port_users[port] == 0:
+                del self._port_users[port]
+                if port not in self._reservations:
+                    self._free_port(port, now)
+
+    @staticmethod
+    def _service_key(service):
+        return f"{service.metadata.namespace}/{service.metadata.name}"
+
+    @staticmethod
+    def _node_ports(service):
+        return {port.node_port for port in service.spec.ports or [] if port.node_port}
+
+    def on_service_event(self, event_type, service):
+        now = time.monotonic()
+        ports = set() if event_type == "DELETED" else self._node_ports(service)
+        with self._lock:
+            self._set_service_ports(self._service_key(service), ports, now)
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "range": f"{self.start}-{self.end}",
+                "used": len(self._port_users),
+                "reserved": len(self._reservations),
+                "cooling_down": len(self._cooldown),
+                "queued": len(self._free),
+                "reuse": self.reuse,
+                "reuse_delay": self.reuse_delay,
+            }
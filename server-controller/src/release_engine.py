@@ -0,0 +1,270 @@
+import copy
+import json
+import subprocess
+import threading
+
+import yaml
+from kubernetes import dynamic
+from kubernetes.dynamic.exceptions import NotFoundError
+
+from metrics import HELM_DURATION, K8S_API_DURATION
+
+FIELD_MANAGER = "server-controller"
+VALUES_ANNOTATION = "mc-server-manager/values"
+# Set on every resource of a release, so the controller can list just its own
+# resources with a label selector
+MANAGED_LABEL = "mc-server-manager/managed"
+
+# Release name the chart is rendered with; swapped for the real one afterwards
+RELEASE_PLACEHOLDER = "mcsm-release-placeholder"
+
+# Values that only ever end up as scalars in the rendered manifests. They're
+# rendered as placeholders and filled in per server, so servers that differ
+# only in these share one cached render. Everything else changes the shape of
+# the output (e.g. serviceType, persistence) and is part of the cache key.
+STRING_VALUES = [
+    ("minecraftServer", "eula"),
+    ("minecraftServer", "gameMode"),
+    ("minecraftServer", "version"),
+    ("minecraftServer", "difficulty"),
+    ("minecraftServer", "motd"),
+]
+# Integers can't be rendered as text placeholders (the chart may type-check
+# them), so they use sentinel numbers instead
+INTEGER_VALUES = {
+    ("minecraftServer", "maxPlayers"): 987650001,
+    ("minecraftServer", "nodePort"): 987650002,
+    ("replicaCount",): 987650003,
+}
+
+# Kinds the chart can create, used to find a release's resources on uninstall
+RELEASE_KINDS = [
+    ("apps/v1", "Deployment"),
+    ("apps/v1", "StatefulSet"),
+    ("v1", "Service"),
+    ("v1", "PersistentVolumeClaim"),
+    ("v1", "ConfigMap"),
+    ("v1", "Secret"),
+]
+
+
+class ReleaseError(Exception):
+    pass
+
+
+def string_placeholder(path):
+    return f"mcsm-{'-'.join(path).lower()}-placeholder"
+
+
+def get_path(values, path):
+    for key in path:
+        if not isinstance(values, dict) or key not in values:
+            return None
+        values = values[key]
+    return values
+
+
+def set_path(values, path, value):
+    for key in path[:-1]:
+        values = values.setdefault(key, {})
+    values[path[-1]] = value
+
+
+class ReleaseEngine:
+    """
+    Installs, upgrades and uninstalls chart releases without running Helm for
+    every operation.
+
+    The chart is rendered with `helm template` once per chart version (and per
+    combination of structural values), with placeholders standing in for the
+    per-server values. Each release then just fills in its values and applies
+    the manifests through server-side apply. Resources keep the labels and
+    annotations Helm uses to track a release, so releases made either way can
+    be managed the same way.
+    """
+
+    def __init__(self, api_client, chart_name, namespace="default"):
+        self.chart_name = chart_name
+        self.namespace = namespace
+        self.dynamic_client = dynamic.DynamicClient(api_client)
+
+        self.chart_version = None
+        self._renders = {}
+        self._render_lock = threading.Lock()
+
+    def _helm(self, *args, stdin=None):
+        try:
+            with HELM_DURATION.labels(args[0]).time():
+                result = subprocess.run(
+                    ["helm", *args], input=stdin, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+                )
+        except subprocess.CalledProcessError as e:
+            raise ReleaseError(f"helm {args[0]} failed: {e.stderr}")
+        return result.stdout
+
+    def _get_chart_version(self):
+        if self.chart_version is None:
+            chart = yaml.safe_load(self._helm("show", "chart", self.chart_name))
+            self.chart_version = chart["version"]
+        return self.chart_version
+
+    def _split_values(self, values):
+        """Split values into the per-server scalars and the structural rest."""
+        structural = copy.deepcopy(values)
+        scalars = {}
+        for path in STRING_VALUES + list(INTEGER_VALUES):
+            value = get_path(structural, path)
+            if value is not None:
+                scalars[path] = value
+                parent = get_path(structural, path[:-1]) if len(path) > 1 else structural
+                del parent[path[-1]]
+        return structural, scalars
+
+    def _render(self, structural, scalar_paths):
+        """
+        Rendered manifests for the given structural values, cached. Only the
+        scalars in `scalar_paths` get placeholders; the rest keep the chart's
+        defaults.
+        """
+        chart_version = self._get_chart_version()
+        key = (chart_version, json.dumps(structural, sort_keys=True), tuple(sorted(scalar_paths)))
+
+        with self._render_lock:
+            if key in self._renders:
+                return self._renders[key]
+
+            args = [
+                "template", RELEASE_PLACEHOLDER, self.chart_name,
+                "--version", chart_version,
+                "--namespace", self.namespace,
+                "--values", "-",
+            ]
+            for path in scalar_paths:
+                if path in INTEGER_VALUES:
+                    args += ["--set", f"{'.'.join(path)}={INTEGER_VALUES[path]}"]
+                else:
+                    args += ["--set-string", f"{'.'.join(path)}={string_placeholder(path)}"]
+
+            # Structural values go in as a values file on stdin (JSON is valid YAML)
+            output = self._helm(*args, stdin=json.dumps(structural))
+            manifests = [doc for doc in yaml.safe_load_all(output) if doc]
+            self._renders[key] = manifests
+            return manifests
+
+    def _substitute(self, node, replacements, sentinels):
+        if isinstance(node, dict):
+            return {key: self._substitute(value, replacements, sentinels) for key, value in node.items()}
+        if isinstance(node, list):
+            return [self._substitute(value, replacements, sentinels) for value in node]
+        if isinstance(node, bool):
+            return node
+        if isinstance(node, int):
+            return sentinels.get(node, node)
+        if isinstance(node, str):
+            if node.isdigit() and int(node) in sentinels:
+                return str(sentinels[int(node)])
+            for placeholder, value in replacements.items():
+                if placeholder in node:
+                    node = node.replace(placeholder, value)
+            return node
+        return node
+
+    def build_manifests(self, release_name, values, labels=None):
+        structural, scalars = self._split_values(values)
+        replacements = {RELEASE_PLACEHOLDER: release_name}
+        sentinels = {}
+        for path, value in scalars.items():
+            if path in INTEGER_VALUES:
+                sentinels[INTEGER_VALUES[path]] = int(value)
+            else:
+                replacements[string_placeholder(path)] = str(value)
+
+        manifests = self._substitute(self._render(structural, list(scalars)), replacements, sentinels)
+        for manifest in manifests:
+            metadata = manifest.setdefault("metadata", {})
+            metadata["namespace"] = self.namespace
+            # The same ownership metadata `helm install` adds
+            metadata.setdefault("labels", {})["app.kubernetes.io/managed-by"] = "Helm"
+            metadata["labels"][MANAGED_LABEL] = "true"
+            # Extra labels are applied by us, so leaving one out of a later
+            # install removes it again
+            metadata["labels"].update(labels or {})
+            annotations = metadata.setdefault("annotations", {})
+            annotations["meta.helm.sh/release-name"] = release_name
+            annotations["meta.helm.sh/release-namespace"] = self.namespace
+            if manifest["kind"] in ("Deployment", "StatefulSet"):
+                annotations[VALUES_ANNOTATION] = json.dumps(values, sort_keys=True)
+        return manifests
+
+    def _resource(self, api_version, kind):
+        return self.dynamic_client.resources.get(api_version=api_version, kind=kind)
+
+    def install(self, release_name, values, labels=None):
+        """Create or update a release so it matches `values`, with optional extra labels."""
+        manifests = self.build_manifests(release_name, values, labels)
+        for manifest in manifests:
+            resource = self._resource(manifest["apiVersion"], manifest["kind"])
+            try:
+                with K8S_API_DURATION.labels("apply").time():
+                    resource.server_side_apply(
+                        body=manifest,
+                        namespace=self.namespace,
+                        field_manager=FIELD_MANAGER,
+                        force_conflicts=True,
+                    )
+            except Exception as e:
+                raise ReleaseError(f"applying {manifest['kind']} {manifest['metadata']['name']} failed: {e}")
+        return f"Applied {len(manifests)} resources for release {release_name}"
+
+    def get_values(self, deployment):
+        """Values a release was installed with, or None if it wasn't installed by the engine."""
+        annotations = deployment.metadata.annotations or {}
+        if VALUES_ANNOTATION not in annotations:
+            return None
+        return json.loads(annotations[VALUES_ANNOTATION])
+
+    def upgrade(self, release_name, deployment, changes, labels=None):
+        """Re-apply a release with some values (and its extra labels) changed."""
+        values = self.get_values(deployment)
+        if values is None:
+            raise ReleaseError(f"release {release_name} was not installed by the release engine")
+        # Start/stop scale the Deployment directly without touching the stored
+        # values, so carry the live replica count over rather than reverting it
+        if deployment.spec.replicas is not None:
+            values["replicaCount"] = deployment.spec.replicas
+        for path, value in changes.items():
+            set_path(values, path, value)
+        return self.install(release_name, values, labels)
+
+    def uninstall(self, release_name):
+        """Delete every resource belonging to a release, including Helm's own release records."""
+        deleted = 0
+        for api_version, kind in RELEASE_KINDS:
+            resource = self._resource(api_version, kind)
+            with K8S_API_DURATION.labels("list").time():
+                items = resource.get(namespace=self.namespace, label_selector=f"release={release_name}").items
+            for item in items:
+                annotations = item.metadata.annotations or {}
+                if annotations.get("helm.sh/resource-policy") == "keep":
+                    continue
+                try:
+                    with K8S_API_DURATION.labels("delete").time():
+                        resource.delete(name=item.metadata.name, namespace=self.namespace)
+                    deleted += 1
+                except NotFoundError:
+                    pass
+
+        # Releases installed by the helm CLI also have their history stored in secrets
+        secrets = self._resource("v1", "Secret")
+        with K8S_API_DURATION.labels("list").time():
+            items = secrets.get(namespace=self.namespace, label_selector=f"owner=helm,name={release_name}").items
+        for item in items:
+            try:
+                with K8S_API_DURATION.labels("delete").time():
+                    secrets.delete(name=item.metadata.name, namespace=self.namespace)
+            except NotFoundError:
+                pass
+
+        if deleted == 0:
+            raise ReleaseError(f"release {release_name} not found")
+        return f"Deleted {deleted} resources for release {release_name}"
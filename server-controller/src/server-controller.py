@@ -1,237 +1,501 @@
-import time
-from flask import Flask, Response, jsonify, request
-from flask_cors import CORS
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
 from kubernetes import client, config
-
-import sys
-import subprocess
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from quart import Quart, Response, jsonify, request
+from quart.utils import run_sync_iterable
+
+import asyncio
+import json
+import os
+import queue
 import logging
 
+from collections import deque
+
 from uuid import uuid4
-from mcstatus import JavaServer
 
-config.load_incluster_config()
+from compression import compress_responses, matching_etag
+from hibernation import HIBERNATED_ANNOTATION, IDLE_TIMEOUT_ANNOTATION, AuditLog, HibernationPolicy
+from history import HistoryStore
+from jobs import JobQueue, QueueFullError
+from k8s_cache import ResourceInformer, ServerCache, list_paged
+from metrics import (
+    FLEET_SIZE, JOB_QUEUE_DEPTH, K8S_API_DURATION, SSE_SUBSCRIBERS, STATUS_SWEEP_DURATION, track_requests
+)
+from poll_scheduler import PollScheduler
+from port_allocator import PortAllocationError, PortAllocator, parse_port_range
+from release_engine import MANAGED_LABEL, ReleaseEngine, ReleaseError
+from server_values import SERVER_DEFAULTS, merge_values
+from status_broadcaster import StatusBroadcaster
+from status_poller import poll_servers
+from template_values import (
+    TemplateError, TemplateNotFound, TemplateUnavailable, TemplateValuesCache, uses_custom_world,
+)
+from wake_listener import WakeListener
+from warm_pool import POOL_LABEL, WarmPool, parse_pool_spec
+
+# Outside a cluster (e.g. benchmarks) fall back to the local kubeconfig
+try:
+    config.load_incluster_config()
+except config.ConfigException:
+    config.load_kube_config()
+
+# Where the controller keeps state that should survive restarts
+DATA_DIR = os.environ.get("DATA_DIR", "/app/data")
 
 k8s_core_v1 = client.CoreV1Api()
 k8s_apps_v1 = client.AppsV1Api()
 
-app = Flask(__name__)
-# CORS(app, origins=["http://localhost:3000"])
+# Renders the chart once and applies releases in-process instead of forking helm
+CHART_NAME = "itzg/minecraft"
+release_engine = ReleaseEngine(client.ApiClient(), CHART_NAME, namespace="default")
+
+
+# Function to add the managed label to servers created before resources were
+# labeled at install time, so the label-filtered cache below still sees them
+def label_existing_servers():
+    unlabeled = f"!{MANAGED_LABEL}"
+    for list_func, patch_func in [
+        (k8s_apps_v1.list_namespaced_deployment, k8s_apps_v1.patch_namespaced_deployment),
+        (k8s_core_v1.list_namespaced_service, k8s_core_v1.patch_namespaced_service),
+    ]:
+        items, _ = list_paged(list_func, "default", label_selector=unlabeled)
+        for item in items:
+            if not (item.metadata.labels or {}).get("release", "").startswith("mc-"):
+                continue
+            try:
+                with K8S_API_DURATION.labels("patch_labels").time():
+                    patch_func(
+                        name=item.metadata.name,
+                        namespace="default",
+                        body={"metadata": {"labels": {MANAGED_LABEL: "true"}}},
+                    )
+                print(f"Labeled {item.metadata.name} as managed")
+            except client.exceptions.ApiException as e:
+                print(f"Error labeling {item.metadata.name}: {e.reason}")
 
-def helm_install_server(server_id, chart_name, values):
-    try:
-        print(values)
-        command = [
-            "helm", "install", server_id,
-            "--set", f"minecraftServer.serviceType=NodePort",
-            "--set", f"minecraftServer.query.enabled={values.get('minecraftServer', {}).get('query', {}).get('enabled', True)}",            "--set", f"minecraftServer.nodePort={values.get('minecraftServer', {}).get('nodePort', 30000)}",
-            "--set", f"minecraftServer.eula={values.get('minecraftServer', {}).get('eula', 'TRUE')}",
-            "--set", f"minecraftServer.gameMode={values.get('minecraftServer', {}).get('gameMode', 'survival')}",
-            "--set", f"minecraftServer.version={values.get('minecraftServer', {}).get('version', 'LATEST')}",
-            "--set", f"minecraftServer.type={values.get('minecraftServer', {}).get('type', 'VANILLA')}",
-            "--set", f"minecraftServer.difficulty={values.get('minecraftServer', {}).get('difficulty', 'easy')}",
-            "--set", f"minecraftServer.maxPlayers={values.get('minecraftServer', {}).get('maxPlayers', 20)}",
-            "--set", f"minecraftServer.motd={values.get('minecraftServer', {}).get('motd', 'test motd!')}",
-            "--set", f"persistence.dataDir.enabled={values.get('persistence', {}).get('dataDir', {}).get('enabled', False)}",
-            chart_name
-            # "--post-renderer", "/app/src/helm-post-renderer.py"
-        ]
-        print(command)
 
-        # Add serverName as a quoted string
-        # server_name = values.get('serverName', 'Minecraft Server')
+label_existing_servers()
 
-        # # Ensure server_name is properly handled as a string with spaces
-        # command.append(server_name)
+# Watch-backed cache of the server Deployments and Services. Only resources
+# carrying the managed label are listed, watched and kept in memory.
+server_cache = ServerCache(k8s_core_v1, k8s_apps_v1, namespace="default", label_selector=f"{MANAGED_LABEL}=true")
+server_cache.start()
+if not server_cache.wait_for_sync(timeout=30):
+    print("Server cache did not sync within 30s, continuing with a partial cache")
 
-        # Run the Helm command
-        result = subprocess.run(
-            command,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        return f"Error during Helm install: {e.stderr}, {e.stdout}"
+# Hands out NodePorts for new servers. NodePorts are cluster-wide, so it
+# watches every Service in the cluster, not just ours.
+port_allocator = PortAllocator(
+    parse_port_range(os.environ.get("NODE_PORT_RANGE", "30000-32767")),
+    reuse=os.environ.get("NODE_PORT_REUSE", "fifo"),
+    reuse_delay=int(os.environ.get("NODE_PORT_REUSE_DELAY", 0)),
+)
+node_port_services = ResourceInformer(k8s_core_v1.list_service_for_all_namespaces, namespace=None)
+# Registered before start, so the initial list and every relist reach the allocator too
+node_port_services.add_listener(port_allocator.on_service_event)
+node_port_services.start()
+if not node_port_services.wait_for_sync(timeout=30):
+    print("NodePort services did not sync within 30s, continuing with a partial port map")
 
+# Lifecycle operations run in the background; endpoints return a job id
+job_queue = JobQueue(workers=16)
+MAX_BULK_PARALLELISM = 64
+job_queue.start()
 
-# Function to run Helm uninstall to delete the server
-def helm_uninstall_server(server_id):
-    try:
-        # Helm uninstall command to delete the release
-        command = [
-            "helm", "uninstall", server_id
-        ]
+# Served by Hypercorn on an event loop. Plain `def` routes run in a worker
+# thread, so blocking Kubernetes, helm and mcstatus calls never stall the loop;
+# `async def` routes must hand any blocking work to a thread themselves.
+app = Quart(__name__)
+# app = cors(app, allow_origin=["http://localhost:3000"])
+track_requests(app)
+compress_responses(app)
 
-        # Execute the command
-        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.stdout
+def build_server_values(values):
+    # Fill in the chart values for a new server from the request body
+    return merge_values(SERVER_DEFAULTS, values)
 
-    except subprocess.CalledProcessError as e:
-        return f"Error during Helm uninstall: {e.stderr}"
 
+# Templates are compiled into chart values once per template version
+SERVER_TEMPLATES_URL = os.environ.get("SERVER_TEMPLATES_URL", "http://server-templates-api-sv:31002")
+template_values = TemplateValuesCache(SERVER_TEMPLATES_URL)
 
-# Function to run Helm upgrade to scale the server to 1 replica (start the server)
-def helm_scale_up(server_id):
-    try:
-        # Helm upgrade command to update the replica count to 1
-        command = [
-            "helm", "upgrade", server_id, "itzg/minecraft",
-            "--reuse-values",  # Reuse existing values
-            "--set", "replicaCount=1"  # Set replicas to 1 (start the server)
-        ]
 
-        # Execute the command
-        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.stdout
+@app.before_serving
+async def open_template_client():
+    template_values.open()
+
 
-    except subprocess.CalledProcessError as e:
-        return f"Error during Helm scale up: {e.stderr}"
+@app.after_serving
+async def close_template_client():
+    await template_values.aclose()
 
 
-# Function to run Helm upgrade to scale the server down to 0 replicas
-def helm_scale_down(server_id):
+# Function to install a new server release from its complete chart values
+def install_server(server_id, server_values):
     try:
-        # Helm upgrade command to update the replica count to 0
-        command = [
-            "helm", "upgrade", server_id, "itzg/minecraft",
-            "--reuse-values",  # Reuse existing values
-            "--set", "replicaCount=0"
-        ]
+        return release_engine.install(server_id, server_values)
+    except ReleaseError as e:
+        return f"Error during install: {e}"
 
-        # Execute the command
-        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.stdout
 
-    except subprocess.CalledProcessError as e:
-        return f"Error during Helm scale down: {e.stderr}"
+# Function to delete a server release and all of its resources
+def uninstall_server(server_id):
+    try:
+        return release_engine.uninstall(server_id)
+    except ReleaseError as e:
+        return f"Error during uninstall: {e}"
 
 
-# Function to get the list of Helm deployments and their replica count
-def get_helm_deployments():
+# Function to scale a server to the given number of replicas (1 starts it, 0 stops it).
+# Patches the Deployment's scale subresource directly rather than upgrading the
+# release; the release engine picks up the live replica count on its next upgrade.
+def set_server_replicas(server_id, replicas):
     try:
-        # Helm list command to get all releases
-        command = ["helm", "list", "--all", "--output", "json"]
-        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        releases = result.stdout
-        
-        # Parse the releases (as JSON)
-        releases_list = eval(releases)  # Or use json.loads(releases) if Helm outputs JSON format
-
-        # Collect deployment statuses
-        deployments = []
-
-        for release in releases_list:
-            # Fetch the release name and namespace
-            release_name = release['name']
-            namespace = release['namespace']
-
-            # Get the deployment corresponding to the Helm release
-            try:
-                deployment = k8s_apps_v1.read_namespaced_deployment(name=f"{release_name}-minecraft", namespace=namespace)
-                replica_count = deployment.spec.replicas
-                status = "running" if replica_count > 0 else "stopped"
-                
-                deployments.append({
-                    "release": release_name,
-                    "replicaCount": replica_count,
-                    "status": status
-                })
-            except client.exceptions.ApiException as e:
-                deployments.append({
-                    "release": release_name,
-                    "status": "error fetching status",
-                    "error": str(e)
-                })
+        with K8S_API_DURATION.labels("patch_scale").time():
+            k8s_apps_v1.patch_namespaced_deployment_scale(
+                name=f"{server_id}-minecraft",
+                namespace="default",
+                body={"spec": {"replicas": replicas}},
+            )
+        return f"Scaled {server_id} to {replicas} replicas"
+    except client.exceptions.ApiException as e:
+        if e.status == 404:
+            return f"Error: server {server_id} not found"
+        return f"Error during scale: {e.reason}"
+
+
+def warm_pool_values(server_type, version):
+    # Pool members keep their world on a volume; the pool adds a NodePort from the allocator
+    return build_server_values({
+        "minecraftServer": {"type": server_type, "version": version},
+        "persistence": {"dataDir": {"enabled": True}},
+    })
+
+
+# Pre-created servers for common (type, version) pairs, e.g. WARM_POOL="VANILLA:LATEST=2,PAPER:1.20.4=1"
+warm_pool = WarmPool(
+    release_engine, server_cache, parse_pool_spec(os.environ.get("WARM_POOL", "")), warm_pool_values,
+    port_allocator=port_allocator,
+)
+warm_pool.start()
+
+
+def is_server_deployment(deployment):
+    # The cache only holds managed resources; leave out unclaimed warm pool members
+    return (deployment.metadata.labels or {}).get(POOL_LABEL) != "true"
+
 
-        return deployments
+def get_server_status(deployment):
+    available_replicas = deployment.status.available_replicas if deployment.status.available_replicas else 0
+    return "Running" if available_replicas > 0 else "Stopped"
 
-    except subprocess.CalledProcessError as e:
-        return {"error": f"Error fetching Helm deployments: {e.stderr}"}
+
+def get_server_type_and_version(deployment):
+    # The chart passes both to the container as environment variables
+    env = {
+        var.name: var.value
+        for container in deployment.spec.template.spec.containers
+        for var in container.env or []
+    }
+    if "TYPE" in env and "VERSION" in env:
+        return env["TYPE"], env["VERSION"]
+
+    values = (release_engine.get_values(deployment) or {}).get("minecraftServer", {})
+    return env.get("TYPE", values.get("type")), env.get("VERSION", values.get("version"))
+
+
+def get_deployment_k8s_data(deployment):
+    # Fetch deployment-specific details
+    server_id = deployment.metadata.labels.get('release')
+    name = deployment.metadata.name
+    available_replicas = deployment.status.available_replicas if deployment.status.available_replicas else 0
+
+    # Look up the Service associated with this deployment
+    service = server_cache.get_service(name)
+    if service is not None and service.spec.ports:
+        # Extract the port from the service spec
+        port = service.spec.ports[0].node_port if service.spec.ports[0].node_port else service.spec.ports[0].port
+    else:
+        port = None  # Default to None if no service found
+    hibernated = service is not None and HIBERNATED_ANNOTATION in (service.metadata.annotations or {})
+
+    return {
+        "name": name,
+        "server_id": server_id,
+        "replicas": available_replicas,
+        "status": get_server_status(deployment),
+        "port": port,
+        "hibernated": hibernated,
+    }
 
 
 def get_server_k8s_data():
-    # List all deployments in the namespace
-    try:
-        deployments = k8s_apps_v1.list_namespaced_deployment(namespace="default")
-    except client.exceptions.ApiException as e:
-        print(f"Error fetching deployments: {e}")
-        return []
+    # Read deployments and services from the watch-backed cache; no API calls here
+    return [
+        get_deployment_k8s_data(deployment)
+        for deployment in server_cache.list_deployments()
+        if is_server_deployment(deployment)
+    ]
 
-    # Filter deployments that start with "mc-"
-    mc_deployments = [deploy for deploy in deployments.items if deploy.metadata.name.startswith("mc-")]
 
-    server_statuses = []
-    for deployment in mc_deployments:
-        # Fetch deployment-specific details
-        server_id = deployment.metadata.labels.get('release')
-        name = deployment.metadata.name
-        available_replicas = deployment.status.available_replicas if deployment.status.available_replicas else 0
-        status = "Running" if available_replicas > 0 else "Stopped"
+# Pings each running server on its own adaptive interval
+poll_scheduler = PollScheduler(poll_servers, fast_interval=2, max_interval=60)
 
-        # Try to get the Service associated with this deployment
-        try:
-            service = k8s_core_v1.read_namespaced_service(name=name, namespace="default")
-            # Extract the port from the service spec
-            port = service.spec.ports[0].node_port if service.spec.ports[0].node_port else service.spec.ports[0].port
-        except client.exceptions.ApiException as e:
-            print(f"Error fetching service for {name}: {e}")
-            port = None  # Default to None if no service found
 
-        server_statuses.append({
-            "name": name,
-            "server_id": server_id,
-            "replicas": available_replicas,
-            "status": status,
-            "port": port,
-        })
+# Where to ping a server; {name} is its Service name and {port} its NodePort
+MC_QUERY_ADDRESS = os.environ.get("MC_QUERY_ADDRESS", "{name}.default.svc.cluster.local:25565")
+
 
-    return server_statuses
+def get_query_address(k8s_server_info):
+    host, _, port = MC_QUERY_ADDRESS.format(**k8s_server_info).rpartition(":")
+    return host, int(port)
 
 
 def combined_k8s_and_query_server_data():
     mc_k8s_info = get_server_k8s_data()
-    print(mc_k8s_info)
-    server_data = []
 
+    # Ping every running server concurrently, each with its own deadline
+    targets = {
+        k8s_server_info['name']: get_query_address(k8s_server_info)
+        for k8s_server_info in mc_k8s_info
+        if k8s_server_info.get('status') == "Running"
+    }
+    poll_results = poll_scheduler.collect(targets)
+
+    server_data = []
     for k8s_server_info in mc_k8s_info:
-        if k8s_server_info.get('status') == "Running":
-            # Connect using the service's name
-            print("connecting using argument: ", f"{k8s_server_info.get('name')}.default.svc.cluster.local", 25565)
-
-            server = JavaServer(f"{k8s_server_info.get('name')}.default.svc.cluster.local", 25565)
-            status = server.status()
-
-            server_data.append({
-                'name': k8s_server_info['name'],
-                'server_id': k8s_server_info['server_id'],
-                'port': k8s_server_info['port'],
-                'status': k8s_server_info['status'],
-                **status.raw
-            })
-        else:
-            server_data.append({
-                'name': k8s_server_info['name'],
-                'server_id': k8s_server_info['server_id'],
-                'port': k8s_server_info['port'],
-                'status': k8s_server_info['status'],
-            })
+        server_info = {
+            'name': k8s_server_info['name'],
+            'server_id': k8s_server_info['server_id'],
+            'port': k8s_server_info['port'],
+            'status': k8s_server_info['status'],
+            'hibernated': k8s_server_info['hibernated'],
+        }
+
+        poll_result = poll_results.get(k8s_server_info['name'])
+        if poll_result is not None:
+            # Whole milliseconds, so jitter doesn't produce a patch every tick
+            server_info['latency'] = round(poll_result['latency'])
+            server_info['error'] = poll_result['error']
+            if poll_result['raw'] is not None:
+                server_info.update(poll_result['raw'])
+
+        server_data.append(server_info)
+
+    return server_data
+
+
+# ----- Hibernation -----
+
+# Selects the controller pod, whose wake listener stands in for hibernated servers
+WAKE_LISTENER_SELECTOR = {"app": "server-controller"}
+
+
+def set_service_selector(service, selector, annotations):
+    # Keys missing from the new selector have to be removed explicitly when patching
+    patch_selector = {key: None for key in (service.spec.selector or {}) if key not in selector}
+    patch_selector.update(selector)
+    with K8S_API_DURATION.labels("patch_service").time():
+        k8s_core_v1.patch_namespaced_service(
+            name=service.metadata.name,
+            namespace="default",
+            body={"metadata": {"annotations": annotations}, "spec": {"selector": patch_selector}},
+        )
+
+
+# Function to stop an idle server and point its Service at the wake listener
+def hibernate_server(server_id, idle_for=None):
+    service = server_cache.get_service(f"{server_id}-minecraft")
+    if service is None:
+        return f"Error: server {server_id} not found"
+
+    try:
+        if HIBERNATED_ANNOTATION not in (service.metadata.annotations or {}):
+            set_service_selector(
+                service,
+                WAKE_LISTENER_SELECTOR,
+                {HIBERNATED_ANNOTATION: json.dumps(service.spec.selector)},
+            )
+    except client.exceptions.ApiException as e:
+        return f"Error during hibernate: {e.reason}"
+
+    output = set_server_replicas(server_id, 0)
+    if "Error" not in output:
+        audit_log.record(server_id, "hibernate", "idle", idle_for=idle_for)
+    return output
+
 
+# Function to start a server, giving its Service back to it if it was hibernated
+def wake_server(server_id, reason):
+    service = server_cache.get_service(f"{server_id}-minecraft")
+    annotations = (service.metadata.annotations or {}) if service is not None else {}
+    if HIBERNATED_ANNOTATION not in annotations and reason == "join":
+        return f"Server {server_id} is not hibernated"
+
+    output = set_server_replicas(server_id, 1)
+    if "Error" in output:
+        return output
+
+    if HIBERNATED_ANNOTATION in annotations:
+        try:
+            set_service_selector(
+                service,
+                json.loads(annotations[HIBERNATED_ANNOTATION]),
+                {HIBERNATED_ANNOTATION: None},
+            )
+        except client.exceptions.ApiException as e:
+            return f"Error during wake: {e.reason}"
+        audit_log.record(server_id, "wake", reason)
+    return output
+
+
+def resolve_hibernated_server(address, port):
+    # Match the port (NodePort) or address (Service DNS name) the player connected to
+    for service in server_cache.services.items():
+        if HIBERNATED_ANNOTATION not in (service.metadata.annotations or {}):
+            continue
+        node_ports = {p.node_port for p in service.spec.ports or []}
+        if port in node_ports or address.split(".")[0] == service.metadata.name:
+            return (service.metadata.labels or {}).get("release")
+    return None
+
+
+audit_log = AuditLog(os.path.join(DATA_DIR, "hibernation-audit.log"))
+hibernation_policy = HibernationPolicy(
+    server_cache,
+    lambda server_id, idle_for: job_queue.submit(server_id, "hibernate", lambda: hibernate_server(server_id, idle_for)),
+    default_idle_timeout=int(os.environ.get("IDLE_TIMEOUT", 1800)),
+)
+wake_listener = WakeListener(
+    int(os.environ.get("WAKE_LISTENER_PORT", 25565)),
+    resolve_hibernated_server,
+    lambda server_id: job_queue.submit(server_id, "wake", lambda: wake_server(server_id, "join")),
+)
+wake_listener.start()
+
+
+# Players/latency/uptime history per server, snapshotted to disk
+status_history = HistoryStore(os.path.join(DATA_DIR, "history.pickle"))
+status_history.start()
+
+
+def collect_server_status():
+    with STATUS_SWEEP_DURATION.time():
+        server_data = combined_k8s_and_query_server_data()
+    hibernation_policy.observe(server_data)
+    status_history.record(server_data)
     return server_data
 
+
+# One status producer per process, shared by every /status/all client. It runs
+# every second, but only pings the servers the scheduler says are due.
+STATUS_INTERVAL = 1
+KEEPALIVE_INTERVAL = 15
+status_broadcaster = StatusBroadcaster(collect_server_status, interval=STATUS_INTERVAL)
+status_broadcaster.start()
+
+
+def on_deployment_event(event_type, deployment):
+    # A server's Deployment changed: poll it and publish on the next sweep, now
+    poll_scheduler.mark(deployment.metadata.name)
+    status_broadcaster.trigger()
+    if event_type == "DELETED":
+        status_history.forget((deployment.metadata.labels or {}).get("release"))
+
+
+server_cache.deployments.add_listener(on_deployment_event)
+
+
+# Gauges are read when /metrics is scraped, so they cost nothing in between
+SSE_SUBSCRIBERS.set_function(status_broadcaster.subscriber_count)
+FLEET_SIZE.set_function(lambda: sum(1 for deploy in server_cache.list_deployments() if is_server_deployment(deploy)))
+JOB_QUEUE_DEPTH.set_function(job_queue.depth)
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
 @app.route("/")
 def hello():
     logging.debug("root!")
     return "Hello from Python!"
 
 
+MAX_LIST_LIMIT = 500
+
+
+def parse_filter(name):
+    # Comma-separated values, matched case-insensitively
+    value = request.args.get(name)
+    if not value:
+        return None
+    return {part.strip().lower() for part in value.split(",") if part.strip()}
+
+
 @app.route("/list")
 def get_servers_list():
-    # deployments = get_helm_deployments()
-    statuses = get_server_k8s_data()
-    return jsonify(statuses)
+    # ?status=running|stopped|hibernated&type=...&version=...&limit=<n>&continue=<token>
+    # Servers are ordered by name; the continue token is the last name of the
+    # previous page, so pages stay consistent while servers come and go
+    statuses = parse_filter("status")
+    types = parse_filter("type")
+    versions = parse_filter("version")
+    after = request.args.get("continue", "")
+    try:
+        limit = max(1, min(int(request.args.get("limit", 100)), MAX_LIST_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    # The listing only changes when a cached Deployment or Service does. Read the
+    # version first, so the ETag can be older than the body but never newer.
+    etag = server_cache.version
+    tag = matching_etag(etag, request.if_none_match)
+    if tag is not None:
+        response = Response(status=304)
+        response.set_etag(tag)
+        return response
+
+    deployments = sorted(
+        (
+            deployment for deployment in server_cache.list_deployments()
+            if is_server_deployment(deployment) and deployment.metadata.name > after
+        ),
+        key=lambda deployment: deployment.metadata.name,
+    )
+
+    servers = []
+    next_token = None
+    for deployment in deployments:
+        if types or versions:
+            server_type, version = get_server_type_and_version(deployment)
+            if types and (server_type or "").lower() not in types:
+                continue
+            if versions and (version or "").lower() not in versions:
+                continue
+        else:
+            server_type, version = None, None
+
+        server = get_deployment_k8s_data(deployment)
+        if statuses:
+            server_statuses = {server["status"].lower()} | ({"hibernated"} if server["hibernated"] else set())
+            if not statuses & server_statuses:
+                continue
+
+        if len(servers) == limit:
+            next_token = servers[-1]["name"]
+            break
+        if server_type is None:
+            server_type, version = get_server_type_and_version(deployment)
+        server["type"], server["version"] = server_type, version
+        servers.append(server)
+
+    response = jsonify({"servers": servers, "continue": next_token})
+    response.set_etag(etag)
+    return response
 
 
 # @app.route("/status")
@@ -241,61 +505,304 @@ def get_servers_list():
 
 
 @app.route("/status/all")
-def status_stream():
-    def event_stream():
-        with app.app_context():
-            while True:
-                statuses = combined_k8s_and_query_server_data()
-                yield f"data: {jsonify(statuses).get_data(as_text=True)}\n\n"
-                time.sleep(5)  # Simulating data streaming every 5 seconds
+async def status_stream():
+    # Reconnecting clients only get the events they missed
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_event_id = None
+    # Waiting clients are just suspended coroutines, not threads
+    subscriber = status_broadcaster.subscribe(last_event_id, loop=asyncio.get_running_loop())
+
+    async def event_stream():
+        try:
+            while not subscriber.closed:
+                events = await subscriber.get_async(timeout=KEEPALIVE_INTERVAL)
+                if events is None:
+                    if subscriber.closed:
+                        break
+                    # Keep idle connections (and any proxies in between) open
+                    yield ": keep-alive\n\n"
+                    continue
+                yield events
+        finally:
+            status_broadcaster.unsubscribe(subscriber)
+
+    response = Response(event_stream(), mimetype="text/event-stream")
+    # The stream is open-ended
+    response.timeout = None
+    return response
+
+
+# Functions that carry out each lifecycle action on an existing server
+LIFECYCLE_ACTIONS = {
+    "start": lambda server_id: wake_server(server_id, "start"),
+    "stop": lambda server_id: set_server_replicas(server_id, 0),
+    "delete": lambda server_id: uninstall_server(server_id),
+}
+
+
+def match_label_selector(labels, selector):
+    # Supports the equality-based selector syntax: "a=b,c!=d,e,!f"
+    labels = labels or {}
+    for requirement in filter(None, (part.strip() for part in selector.split(","))):
+        if "!=" in requirement:
+            key, value = (x.strip() for x in requirement.split("!=", 1))
+            if labels.get(key) == value:
+                return False
+        elif "=" in requirement:
+            key, value = (x.strip() for x in requirement.replace("==", "=").split("=", 1))
+            if labels.get(key) != value:
+                return False
+        elif requirement.startswith("!"):
+            if requirement[1:] in labels:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+def run_bulk_action(server_ids, action, parallelism):
+    # Keep at most `parallelism` jobs from this request in flight, and yield
+    # each server's result as soon as it finishes
+    remaining = deque(server_ids)
+    finished = queue.Queue()
+
+    def submit_next():
+        server_id = remaining.popleft()
+        try:
+            job = job_queue.submit(server_id, action, lambda: LIFECYCLE_ACTIONS[action](server_id))
+        except QueueFullError as e:
+            finished.put({"server_id": server_id, "action": action, "status": "failed", "output": str(e)})
+            return
+        job.add_done_callback(lambda job: finished.put(job.to_dict()))
+
+    for _ in range(min(parallelism, len(remaining))):
+        submit_next()
+
+    counts = {"succeeded": 0, "failed": 0, "superseded": 0}
+    for _ in range(len(server_ids)):
+        result = finished.get()
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        yield json.dumps(result) + "\n"
+        if remaining:
+            submit_next()
+
+    yield json.dumps({"done": True, "total": len(server_ids), **counts}) + "\n"
+
+
+def enqueue_job(server_id, action, func, on_superseded=None):
+    try:
+        job = job_queue.submit(server_id, action, func, on_superseded)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({
+        "message": f"Queued {action} for server {server_id}",
+        "server_id": server_id,
+        "job_id": job.id,
+        "status": job.status,
+    }), 202
+
+
+def enqueue_create(server_id, port, create, release=None):
+    # Give the reserved port back if the server never gets created (it fails,
+    # isn't queued, or is superseded); once its Service exists the port watch
+    # takes over. `release` gives back anything else reserved for a create
+    # that never runs.
+    def release_port():
+        if port is not None:
+            port_allocator.release(port)
+
+    def release_reserved():
+        release_port()
+        if release is not None:
+            release()
+
+    def run():
+        output = create()
+        if "Error" in output:
+            release_port()
+        return output
+
+    response = enqueue_job(server_id, "create", run, on_superseded=release_reserved)
+    if response[1] != 202:
+        release_reserved()
+    return response
+
+
+@app.get("/jobs/<job_id>")
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+
+    return jsonify(job.to_dict()), 200
+
+
+@app.get("/<server_id>/history")
+def get_server_history(server_id):
+    # ?window=<seconds, default 1 hour>&resolution=<5|60|900, optional>
+    window = request.args.get("window", 3600, type=int)
+    resolution = request.args.get("resolution", None, type=int)
+
+    result = status_history.query(server_id, window, resolution)
+    if result is None:
+        return jsonify({"error": f"No history for server {server_id}"}), 404
+
+    resolution, points = result
+    return jsonify({"server_id": server_id, "window": window, "resolution": resolution, "points": points}), 200
+
+
+def set_idle_timeout_annotation(server_id, annotation):
+    with K8S_API_DURATION.labels("patch_deployment").time():
+        k8s_apps_v1.patch_namespaced_deployment(
+            name=f"{server_id}-minecraft",
+            namespace="default",
+            body={"metadata": {"annotations": {IDLE_TIMEOUT_ANNOTATION: annotation}}},
+        )
+
 
-    return Response(event_stream(), mimetype="text/event-stream")
+@app.put("/<server_id>/hibernation")
+async def set_hibernation(server_id):
+    # Body: {"idle_timeout": seconds}, 0 disables hibernation, null restores the default
+    body = await request.get_json() or {}
+    idle_timeout = body.get("idle_timeout")
+    try:
+        annotation = None if idle_timeout is None else str(int(idle_timeout))
+    except (TypeError, ValueError):
+        return jsonify({"error": "idle_timeout must be a number of seconds"}), 400
+
+    try:
+        await asyncio.to_thread(set_idle_timeout_annotation, server_id, annotation)
+    except client.exceptions.ApiException as e:
+        if e.status == 404:
+            return jsonify({"error": f"Server {server_id} not found"}), 404
+        return jsonify({"error": e.reason}), 500
+
+    return jsonify({"message": f"Updated hibernation for server {server_id}", "idle_timeout": idle_timeout}), 200
+
+
+@app.get("/hibernation/events")
+def get_hibernation_events():
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(audit_log.recent(limit, request.args.get("server_id"))), 200
+
+
+@app.get("/ports")
+def get_port_stats():
+    return jsonify(port_allocator.stats()), 200
+
+
+@app.get("/pool")
+def get_pool_stats():
+    return jsonify(warm_pool.stats()), 200
+
+
+@app.post("/bulk")
+async def bulk_action():
+    # Body: {"action": "start"|"stop"|"delete", "server_ids": [...] or "selector": "...", "parallelism": n}
+    body = await request.get_json() or {}
+    action = body.get("action")
+    if action not in LIFECYCLE_ACTIONS:
+        return jsonify({"error": f"action must be one of {', '.join(LIFECYCLE_ACTIONS)}"}), 400
+
+    if "server_ids" in body:
+        server_ids = list(dict.fromkeys(body["server_ids"]))
+    elif "selector" in body:
+        server_ids = [
+            deployment.metadata.labels.get('release')
+            for deployment in server_cache.list_deployments()
+            if is_server_deployment(deployment)
+            and match_label_selector(deployment.metadata.labels, body["selector"])
+        ]
+    else:
+        return jsonify({"error": "either server_ids or selector is required"}), 400
+
+    try:
+        parallelism = max(1, min(int(body.get("parallelism", 8)), MAX_BULK_PARALLELISM))
+    except (TypeError, ValueError):
+        return jsonify({"error": "parallelism must be a number"}), 400
+
+    # Stream one NDJSON line per server as it completes, then a summary line.
+    # Waiting for the next result blocks, so each step runs in a worker thread.
+    response = Response(
+        run_sync_iterable(run_bulk_action(server_ids, action, parallelism)), mimetype="application/x-ndjson"
+    )
+    response.timeout = None
+    return response
 
 
 @app.delete("/<server_id>")
 def delete_server(server_id):
-    # Call the function to uninstall the server
-    output = helm_uninstall_server(server_id)
-    if "Error" in output:
-        return jsonify({"error": output}), 500
-
-    return jsonify({"message": f"Successfully deleted server {server_id}", "output": output}), 200
+    # Queue the uninstall; the job reports the outcome
+    return enqueue_job(server_id, "delete", lambda: LIFECYCLE_ACTIONS["delete"](server_id))
 
 
 @app.post("/create-server")
-def create_server():
-    # Extract server details from the request body
-    server_values = request.get_json()
+async def create_server():
+    # Extract server details from the request body; the rest only touches
+    # in-memory state (and the template service), the install itself runs as a job
+    request_values = await request.get_json() or {}
+
+    # ?template=<id> starts from the template's compiled values instead of the
+    # defaults; the request body only overrides what it sets
+    template_id = request.args.get("template")
+    try:
+        base_values = await template_values.get(template_id) if template_id else SERVER_DEFAULTS
+    except TemplateNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except TemplateUnavailable as e:
+        return jsonify({"error": str(e)}), 502
+    except TemplateError as e:
+        return jsonify({"error": str(e)}), 422
+    server_values = merge_values(base_values, request_values)
+
+    # Hold the requested NodePort, so concurrent creates can't both get it
+    requested_port = server_values['minecraftServer'].get('nodePort')
+    try:
+        port = port_allocator.reserve_port(int(requested_port)) if requested_port else None
+    except ValueError:
+        return jsonify({"error": "nodePort must be a number"}), 400
+    except PortAllocationError as e:
+        return jsonify({"error": str(e)}), 409
+
+    # Claim a pre-created server from the warm pool when one matches; it keeps
+    # its own NodePort unless another was asked for. A pool member's world is
+    # already generated, so templates that shape the world can't use one.
+    member = None if uses_custom_world(server_values) else warm_pool.reserve(server_values)
+    if member is not None:
+        return enqueue_create(
+            member, port, lambda: warm_pool.claim(member, server_values), release=lambda: warm_pool.release(member)
+        )
+
+    if port is None:
+        try:
+            port = port_allocator.reserve()
+        except PortAllocationError as e:
+            return jsonify({"error": str(e)}), 503
+    server_values['minecraftServer']['nodePort'] = port
 
     # Example values from request body
     server_id = "mc-" + str(uuid4())
     print(server_values)
 
-    # Call the Helm install function
-    chart_name = "itzg/minecraft"  # Path to the Helm chart
-    install_output = helm_install_server(server_id, chart_name, server_values)
-
-    return jsonify({"message": "Server created", "output": install_output})
+    # Queue the install of the server release
+    return enqueue_create(server_id, port, lambda: install_server(server_id, server_values))
 
 
 @app.post("/<server_id>/stop")
 def stop_server(server_id):
-    # Call the function to scale down the server
-    output = helm_scale_down(server_id)
-    if "Error" in output:
-        return jsonify({"error": output}), 500
-
-    return jsonify({"message": f"Successfully stopped server {server_id}", "output": output}), 200
+    # Queue scaling the server down
+    return enqueue_job(server_id, "stop", lambda: LIFECYCLE_ACTIONS["stop"](server_id))
 
 
 @app.post("/<server_id>/start")
 def start_server(server_id):
-    # Call the function to scale up the server
-    output = helm_scale_up(server_id)
-    if "Error" in output:
-        return jsonify({"error": output}), 500
-
-    return jsonify({"message": f"Successfully started server {server_id}", "output": output}), 200
+    # Queue scaling the server up
+    return enqueue_job(server_id, "start", lambda: LIFECYCLE_ACTIONS["start"](server_id))
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0")
+    hypercorn_config = Config()
+    hypercorn_config.bind = [f"0.0.0.0:{int(os.environ.get('PORT', 5000))}"]
+    asyncio.run(serve(app, hypercorn_config))
@@ -0,0 +1,63 @@
+import copy
+
+# Chart values every new server starts from
+SERVER_DEFAULTS = {
+    "replicaCount": 1,
+    "minecraftServer": {
+        "serviceType": "NodePort",
+        "query": {"enabled": True},
+        "eula": "TRUE",
+        "gameMode": "survival",
+        "version": "LATEST",
+        "type": "VANILLA",
+        "difficulty": "easy",
+        "maxPlayers": 20,
+        "motd": "test motd!",
+    },
+    "persistence": {
+        "dataDir": {"enabled": False},
+    },
+}
+
+# The values a create request may set, over the defaults or a template's values
+REQUEST_VALUES = {
+    "minecraftServer": {
+        "query": {"enabled": None},
+        "nodePort": None,
+        "eula": None,
+        "gameMode": None,
+        "version": None,
+        "type": None,
+        "difficulty": None,
+        "maxPlayers": None,
+        "motd": None,
+    },
+    "persistence": {
+        "dataDir": {"enabled": None},
+    },
+}
+
+
+def _merge_into(target, overrides, allowed):
+    for key, value in overrides.items():
+        if key not in allowed or value is None:
+            continue
+        if isinstance(allowed[key], dict):
+            if isinstance(value, dict):
+                _merge_into(target.setdefault(key, {}), value, allowed[key])
+        else:
+            target[key] = value
+
+
+def merge_values(base, overrides, allowed=REQUEST_VALUES):
+    """
+    Returns a copy of `base` with the parts of `overrides` that `allowed`
+    lists applied on top; anything else in `overrides` is ignored.
+    """
+    merged = copy.deepcopy(base)
+    if isinstance(overrides, dict):
+        _merge_into(merged, overrides, allowed)
+    # Without a nodePort, Kubernetes assigns one
+    if not merged.get("minecraftServer", {}).get("nodePort"):
+        merged.get("minecraftServer", {}).pop("nodePort", None)
+    return merged
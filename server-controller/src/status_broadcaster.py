@@ -0,0 +1,231 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from collections import deque
+
+
+def format_event(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class Subscriber:
+    """
+    A single SSE client's view of the status stream.
+
+    Each publish is delivered as one batch of events through a small bounded
+    queue. When the client falls behind, its pending batches are replaced by a
+    single snapshot of the current state, so it catches up without missing
+    anything. A client that stays behind for `max_overflows` publishes in a row
+    is disconnected.
+
+    With an event `loop`, the client can wait with `get_async` on that loop
+    instead of blocking a thread.
+    """
+
+    def __init__(self, maxsize=4, max_overflows=12, loop=None):
+        self.queue = queue.Queue(maxsize)
+        self.max_overflows = max_overflows
+        self.overflows = 0
+        self.closed = False
+        self.loop = loop
+        self._ready = asyncio.Event() if loop is not None else None
+
+    def _notify(self):
+        # Items are offered from the broadcaster thread; wake the waiter on its own loop
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                pass
+
+    def offer(self, item, resync):
+        """
+        Queue `item` for this client, returns False if it should be dropped.
+        `resync` is called to build a snapshot if the client has fallen behind.
+        """
+        try:
+            self.queue.put_nowait(item)
+            self.overflows = 0
+            self._notify()
+            return True
+        except queue.Full:
+            pass
+
+        self.overflows += 1
+        if self.overflows >= self.max_overflows:
+            return False
+
+        # Coalesce: the pending batches are replaced by one snapshot
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put_nowait(resync())
+        self._notify()
+        return True
+
+    async def get_async(self, timeout=None):
+        """Returns the next item, or None on timeout or once closed. Call on `loop`."""
+        while not self.closed:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._ready.clear()
+            # An offer may have landed between the check and the clear
+            if not self.queue.empty():
+                continue
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return None
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+
+class StatusBroadcaster:
+    """
+    Runs `collect` on a fixed schedule in one background thread and fans the
+    result out to every subscriber, so the cost of collecting status doesn't
+    depend on how many clients are watching.
+
+    `collect` returns a list of dicts identified by `key`. Subscribers get an
+    initial `snapshot` event with the full list, followed by one `patch` event
+    per item whose fields changed (only the changed fields are sent) and a
+    `remove` event per item that disappeared. Every event has an increasing
+    id, and the most recent `history_size` events are kept so a client that
+    reconnects with a Last-Event-ID only receives what it missed.
+    """
+
+    def __init__(self, collect, interval=5, key="name", queue_size=4, max_overflows=12, history_size=1024):
+        self.collect = collect
+        self.interval = interval
+        self.key = key
+        self.queue_size = queue_size
+        self.max_overflows = max_overflows
+
+        # Ids start from the wall clock so they keep increasing across restarts
+        self.last_event_id = int(time.time() * 1000)
+        self.state = {}
+        self.history = deque(maxlen=history_size)
+
+        self._snapshot = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """Run the next collection now instead of waiting for the interval."""
+        self._wake.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def snapshot(self):
+        """Current state as a single snapshot event. Call with the lock held."""
+        if self._snapshot is None:
+            self._snapshot = format_event(
+                self.last_event_id, "snapshot", json.dumps(list(self.state.values()))
+            )
+        return self._snapshot
+
+    def _missed_events(self, last_event_id):
+        """Events after `last_event_id`, or None if they're no longer in history."""
+        if last_event_id is None or last_event_id > self.last_event_id:
+            return None
+        if last_event_id == self.last_event_id:
+            return ""
+        if not self.history or self.history[0][0] > last_event_id + 1:
+            return None
+        return "".join(text for event_id, text in self.history if event_id > last_event_id)
+
+    def subscribe(self, last_event_id=None, loop=None):
+        subscriber = Subscriber(self.queue_size, self.max_overflows, loop)
+        with self._lock:
+            missed = self._missed_events(last_event_id)
+            if missed is None:
+                subscriber.offer(self.snapshot(), self.snapshot)
+            elif missed:
+                subscriber.offer(missed, self.snapshot)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def _diff(self, new_state):
+        events = []
+        for name, item in new_state.items():
+            old = self.state.get(name)
+            if old is None:
+                events.append(("patch", {self.key: name, "set": item, "unset": []}))
+                continue
+
+            changed = {field: value for field, value in item.items() if field not in old or old[field] != value}
+            removed = [field for field in old if field not in item]
+            if changed or removed:
+                events.append(("patch", {self.key: name, "set": changed, "unset": removed}))
+
+        for name in self.state:
+            if name not in new_state:
+                events.append(("remove", {self.key: name}))
+
+        return events
+
+    def publish(self, items):
+        new_state = {item[self.key]: item for item in items}
+        dropped = []
+
+        with self._lock:
+            texts = []
+            for event, data in self._diff(new_state):
+                self.last_event_id += 1
+                text = format_event(self.last_event_id, event, json.dumps(data))
+                self.history.append((self.last_event_id, text))
+                texts.append(text)
+
+            self.state = new_state
+            if not texts:
+                return
+            self._snapshot = None
+            batch = "".join(texts)
+
+            for subscriber in self._subscribers:
+                if not subscriber.offer(batch, self.snapshot):
+                    dropped.append(subscriber)
+
+        for subscriber in dropped:
+            print("Dropping slow status subscriber")
+            self.unsubscribe(subscriber)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.publish(self.collect())
+            except Exception as e:
+                print(f"Error collecting server status: {e}")
+
+            elapsed = time.monotonic() - started
+            self._wake.wait(max(0, self.interval - elapsed))
+            self._wake.clear()
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from mcstatus import JavaServer
+
+from metrics import MC_PING_DURATION
+
+# Seconds a single server gets to answer a status ping
+DEFAULT_TIMEOUT = 2.0
+# Maximum number of pings in flight at once
+DEFAULT_CONCURRENCY = 64
+
+
+async def _poll_one(host, port, timeout, semaphore):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            server = JavaServer(host, port, timeout=timeout)
+            status = await asyncio.wait_for(server.async_status(tries=1), timeout)
+            result = {
+                "online": True,
+                "latency": status.latency,
+                "error": None,
+                "raw": status.raw,
+            }
+        except asyncio.TimeoutError:
+            result = {
+                "online": False,
+                "latency": (time.perf_counter() - start) * 1000,
+                "error": "timeout",
+                "raw": None,
+            }
+        except Exception as e:
+            result = {
+                "online": False,
+                "latency": (time.perf_counter() - start) * 1000,
+                "error": str(e) or type(e).__name__,
+                "raw": None,
+            }
+
+        outcome = "ok" if result["online"] else "timeout" if result["error"] == "timeout" else "error"
+        MC_PING_DURATION.labels(outcome).observe(time.perf_counter() - start)
+        return result
+
+
+async def poll_servers_async(targets, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Ping every server in `targets` (a dict of key -> (host, port)) concurrently.
+
+    Each ping gets its own deadline and errors are isolated per server, so one
+    hung or broken server can't stall or break the rest. Returns a dict of
+    key -> result, where a result always has `online`, `latency` (ms), `error`
+    (None, "timeout" or the error message) and `raw` (the status payload).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    keys = list(targets)
+    results = await asyncio.gather(
+        *(_poll_one(*targets[key], timeout, semaphore) for key in keys)
+    )
+    return dict(zip(keys, results))
+
+
+def poll_servers(targets, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    if not targets:
+        return {}
+    return asyncio.run(poll_servers_async(targets, timeout, concurrency))
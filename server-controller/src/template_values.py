@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+
+import httpx
+
+from metrics import TEMPLATE_COMPILES, TEMPLATE_VALUES_LOOKUPS
+from server_values import SERVER_DEFAULTS, merge_values
+
+# Template worldType -> the chart's levelType. Older templates put a game mode
+# in worldType, so those are accepted as well.
+LEVEL_TYPES = {
+    "NORMAL": "DEFAULT",
+    "DEFAULT": "DEFAULT",
+    "FLAT": "FLAT",
+    "LARGEBIOMES": "LARGEBIOMES",
+    "LARGE_BIOMES": "LARGEBIOMES",
+    "AMPLIFIED": "AMPLIFIED",
+}
+GAME_MODES = ("SURVIVAL", "CREATIVE", "ADVENTURE", "SPECTATOR")
+DIFFICULTIES = ("PEACEFUL", "EASY", "NORMAL", "HARD")
+MOD_LOADERS = ("FORGE", "NEOFORGE", "FABRIC", "QUILT")
+# Server type for templates that list mods without saying which loader
+DEFAULT_MOD_LOADER = "FORGE"
+# Template fields that map straight onto the chart's minecraftServer values.
+# A template's own `version` is its revision, so the game version is minecraftVersion.
+PASSTHROUGH_FIELDS = {"type": "type", "minecraftVersion": "version", "motd": "motd", "maxPlayers": "maxPlayers"}
+
+
+class TemplateError(Exception):
+    pass
+
+
+class TemplateNotFound(TemplateError):
+    pass
+
+
+class TemplateUnavailable(TemplateError):
+    pass
+
+
+def compile_template(template):
+    """
+    Turns a template document into chart values for a new server, starting
+    from the server defaults. Raises TemplateError if the template can't be
+    turned into a valid server.
+    """
+    name = template.get("templateName", template.get("id"))
+    server = {
+        value: template[field] for field, value in PASSTHROUGH_FIELDS.items() if template.get(field) is not None
+    }
+
+    world_type = str(template.get("worldType") or "NORMAL").upper()
+    if world_type in GAME_MODES:
+        server["gameMode"] = world_type.lower()
+    elif world_type in LEVEL_TYPES:
+        server["levelType"] = LEVEL_TYPES[world_type]
+    else:
+        raise TemplateError(f"template {name} has an unknown worldType {world_type}")
+
+    if template.get("gameMode") is not None:
+        if str(template["gameMode"]).upper() not in GAME_MODES:
+            raise TemplateError(f"template {name} has an unknown gameMode {template['gameMode']}")
+        server["gameMode"] = str(template["gameMode"]).lower()
+
+    difficulty = str(template.get("difficulty") or "EASY").upper()
+    if difficulty not in DIFFICULTIES:
+        raise TemplateError(f"template {name} has an unknown difficulty {difficulty}")
+    server["difficulty"] = difficulty.lower()
+
+    if "maxPlayers" in server and not (isinstance(server["maxPlayers"], int) and server["maxPlayers"] > 0):
+        raise TemplateError(f"template {name} has an invalid maxPlayers {server['maxPlayers']}")
+
+    mods = template.get("mods") or []
+    if not isinstance(mods, list) or not all(isinstance(mod, str) and mod.strip() for mod in mods):
+        raise TemplateError(f"template {name} has an invalid mods list")
+    if mods:
+        server_type = str(server.get("type", DEFAULT_MOD_LOADER)).upper()
+        if server_type not in MOD_LOADERS:
+            raise TemplateError(f"template {name} has mods but type {server_type} can't load them")
+        server["type"] = server_type
+        # Installed from Modrinth by the server image at startup
+        server["modrinth"] = {"projects": [mod.strip().lower().replace(" ", "-") for mod in mods]}
+
+    values = merge_values(SERVER_DEFAULTS, {})
+    values["minecraftServer"].update(server)
+    return values
+
+
+def uses_custom_world(values):
+    """Whether values change how the world is generated, so a warm pool member can't stand in."""
+    server = values["minecraftServer"]
+    return server.get("levelType", "DEFAULT") != "DEFAULT" or bool(server.get("modrinth"))
+
+
+class CompiledTemplate:
+    def __init__(self, values, etag):
+        self.values = values
+        self.etag = etag
+        self.checked_at = time.monotonic()
+
+
+class TemplateValuesCache:
+    """
+    Compiled chart values per template, fetched from server-templates-api.
+
+    A template is fetched and compiled once per version. An entry checked in
+    the last `ttl` seconds is used as is; after that it's revalidated with a
+    conditional GET on its ETag (the template's version), and only fetched
+    and compiled again if the template changed. Concurrent lookups of the
+    same template share one call. At most `max_entries` templates are kept,
+    evicting the least recently used.
+    """
+
+    def __init__(self, base_url, ttl=5, timeout=5, max_entries=256):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.client = None
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def open(self):
+        self.client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def get(self, template_id):
+        """Returns the compiled values for a template; don't modify them."""
+        entry = self._entries.get(template_id)
+        if entry is not None and time.monotonic() - entry.checked_at < self.ttl:
+            self._entries.move_to_end(template_id)
+            TEMPLATE_VALUES_LOOKUPS.labels("hit").inc()
+            return entry.values
+
+        task = self._inflight.get(template_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(template_id, entry))
+            self._inflight[template_id] = task
+            task.add_done_callback(lambda task: self._done(template_id, task))
+        return (await asyncio.shield(task)).values
+
+    def _done(self, template_id, task):
+        self._inflight.pop(template_id, None)
+        # Mark any error as seen, in case every caller went away before it came
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(self, template_id, entry):
+        headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else {}
+        try:
+            response = await self.client.get(f"/template/{template_id}", headers=headers)
+        except httpx.HTTPError as e:
+            raise TemplateUnavailable(f"could not fetch template {template_id}: {e}")
+
+        if response.status_code == 304 and entry is not None:
+            TEMPLATE_VALUES_LOOKUPS.labels("revalidated").inc()
+            entry.checked_at = time.monotonic()
+            self._store(template_id, entry)
+            return entry
+        if response.status_code in (400, 404):
+            raise TemplateNotFound(f"template {template_id} not found")
+        if response.status_code != 200:
+            raise TemplateUnavailable(f"could not fetch template {template_id}: HTTP {response.status_code}")
+
+        TEMPLATE_VALUES_LOOKUPS.labels("compiled").inc()
+        with TEMPLATE_COMPILES.time():
+            values = compile_template(response.json())
+        entry = CompiledTemplate(values, response.headers.get("etag"))
+        self._store(template_id, entry)
+        return entry
+
+    def _store(self, template_id, entry):
+        self._entries[template_id] = entry
+        self._entries.move_to_end(template_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
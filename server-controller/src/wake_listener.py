@@ -0,0 +1,133 @@
+import json
+import socketserver
+import struct
+import threading
+
+# Status shown in the server list while a server is hibernating
+HIBERNATING_DESCRIPTION = "Server is hibernating, join to wake it up"
+WAKING_MESSAGE = "Server is starting up, try again in a minute"
+
+
+def read_varint(stream):
+    value = 0
+    for i in range(5):
+        byte = stream.read(1)
+        if not byte:
+            raise EOFError("connection closed")
+        value |= (byte[0] & 0x7F) << (7 * i)
+        if not byte[0] & 0x80:
+            return value
+    raise ValueError("VarInt too long")
+
+
+def write_varint(value):
+    out = bytearray()
+    value &= 0xFFFFFFFF
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def write_string(value):
+    data = value.encode("utf-8")
+    return write_varint(len(data)) + data
+
+
+def make_packet(packet_id, payload=b""):
+    body = write_varint(packet_id) + payload
+    return write_varint(len(body)) + body
+
+
+class PacketReader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, n):
+        chunk = self.data[self.offset:self.offset + n]
+        self.offset += n
+        return chunk
+
+
+def read_packet(stream):
+    length = read_varint(stream)
+    data = stream.read(length)
+    if len(data) < length:
+        raise EOFError("connection closed")
+    reader = PacketReader(data)
+    return read_varint(reader), reader
+
+
+class WakeHandler(socketserver.StreamRequestHandler):
+    timeout = 10
+
+    def handle(self):
+        try:
+            packet_id, packet = read_packet(self.rfile)
+            if packet_id != 0x00:
+                return
+            protocol = read_varint(packet)
+            address = packet.read(read_varint(packet)).decode("utf-8", "replace")
+            port = struct.unpack(">H", packet.read(2))[0]
+            next_state = read_varint(packet)
+
+            server_id = self.server.resolve(address, port)
+            if next_state == 1:
+                self.handle_status(protocol, server_id)
+            elif next_state == 2:
+                self.handle_login(server_id)
+        except (EOFError, ValueError, OSError, struct.error):
+            pass
+
+    def handle_status(self, protocol, server_id):
+        # Status request, answered with a placeholder status
+        packet_id, _ = read_packet(self.rfile)
+        if packet_id != 0x00:
+            return
+        status = {
+            "version": {"name": "Hibernating", "protocol": protocol},
+            "players": {"max": 0, "online": 0},
+            "description": {"text": HIBERNATING_DESCRIPTION if server_id else "Unknown server"},
+        }
+        self.wfile.write(make_packet(0x00, write_string(json.dumps(status))))
+
+        # Ping, echoed back as the pong
+        packet_id, packet = read_packet(self.rfile)
+        if packet_id == 0x01:
+            self.wfile.write(make_packet(0x01, packet.read(8)))
+
+    def handle_login(self, server_id):
+        if server_id:
+            self.server.wake(server_id)
+            message = WAKING_MESSAGE
+        else:
+            message = "Unknown server"
+        # Login disconnect with the reason shown to the player
+        self.wfile.write(make_packet(0x00, write_string(json.dumps({"text": message}))))
+
+
+class WakeListener(socketserver.ThreadingTCPServer):
+    """
+    Answers Minecraft server-list pings for hibernated servers, and wakes the
+    real server on the first join attempt.
+
+    A hibernated server's Service is pointed at the controller, so connections
+    arrive here. `resolve(address, port)` maps the address and port the client
+    connected to onto a server id (or None), and `wake(server_id)` starts it.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port, resolve, wake):
+        super().__init__(("0.0.0.0", port), WakeHandler)
+        self.resolve = resolve
+        self.wake = wake
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
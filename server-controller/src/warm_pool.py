@@ -0,0 +1,204 @@
+import threading
+import time
+
+from collections import deque
+from uuid import uuid4
+
+from release_engine import INTEGER_VALUES, STRING_VALUES, ReleaseError, get_path
+
+POOL_LABEL = "mc-server-manager/pool"
+POOL_STATE_LABEL = "mc-server-manager/pool-state"
+
+
+def parse_pool_spec(spec):
+    """Parses "VANILLA:LATEST=2,PAPER:1.20.4=1" into {("VANILLA", "LATEST"): 2, ...}."""
+    targets = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, count = entry.partition("=")
+        server_type, _, version = key.partition(":")
+        targets[(server_type.strip().upper(), version.strip() or "LATEST")] = int(count or 1)
+    return targets
+
+
+def pool_key(values):
+    return (values["minecraftServer"]["type"].upper(), values["minecraftServer"]["version"])
+
+
+class WarmPool:
+    """
+    Keeps a number of pre-created servers for common (type, version) pairs.
+
+    Pool members are installed with persistence and started once so the world
+    gets generated, then stopped and marked ready. Creating a server with a
+    matching type and version claims a ready member instead of installing a
+    new release: its labels are cleared and the user's values applied, while
+    the pool is refilled in the background. A member reserved for a create
+    that never claims it goes back to the pool when the create is dropped,
+    or after `reservation_ttl` seconds.
+
+    With a `port_allocator`, each member's NodePort is reserved from it like
+    any other create, so Kubernetes never picks one that's held for a queued
+    create.
+    """
+
+    def __init__(self, release_engine, server_cache, targets, base_values, refill_interval=30, port_allocator=None,
+                 reservation_ttl=300):
+        self.release_engine = release_engine
+        self.reservation_ttl = reservation_ttl
+        self.port_allocator = port_allocator
+        self.server_cache = server_cache
+        self.targets = targets
+        self.base_values = base_values
+        self.refill_interval = refill_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.claim_latencies = deque(maxlen=1000)
+        self._reserved = {}
+        # Members installed but not yet seen in the server cache
+        self._installing = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.targets:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _members(self):
+        members = []
+        for deployment in self.server_cache.list_deployments():
+            labels = deployment.metadata.labels or {}
+            if labels.get(POOL_LABEL) != "true":
+                continue
+            values = self.release_engine.get_values(deployment)
+            if values is None:
+                continue
+            members.append((labels.get("release"), labels.get(POOL_STATE_LABEL), pool_key(values), deployment))
+        return members
+
+    def reserve(self, values):
+        """Reserve a ready member matching `values`, returns its release name or None."""
+        key = pool_key(values)
+        if key not in self.targets:
+            return None
+
+        with self._lock:
+            self._expire_reservations()
+            for release, state, member_key, deployment in self._members():
+                if state == "ready" and member_key == key and release not in self._reserved:
+                    self._reserved[release] = time.monotonic()
+                    self.hits += 1
+                    return release
+            self.misses += 1
+        return None
+
+    def release(self, release):
+        """Give back a reserved member whose create won't run."""
+        with self._lock:
+            self._reserved.pop(release, None)
+        self._wake.set()
+
+    def _expire_reservations(self):
+        now = time.monotonic()
+        for release, reserved_at in list(self._reserved.items()):
+            if now - reserved_at > self.reservation_ttl:
+                print(f"Reservation for pool member {release} expired")
+                del self._reserved[release]
+
+    def claim(self, release, values):
+        """Turn a reserved member into a regular server with the user's values."""
+        try:
+            deployment = self.server_cache.get_deployment(f"{release}-minecraft")
+            if deployment is None:
+                return f"Error: pool member {release} disappeared"
+
+            # Per-server settings come from the request; the member keeps its
+            # type, version and persistence
+            changes = {
+                path: get_path(values, path)
+                for path in STRING_VALUES + list(INTEGER_VALUES)
+                if get_path(values, path) is not None
+            }
+            changes[("replicaCount",)] = 1
+            output = self.release_engine.upgrade(release, deployment, changes, labels=None)
+        except ReleaseError as e:
+            output = f"Error during pool claim: {e}"
+        finally:
+            with self._lock:
+                reserved_at = self._reserved.pop(release, None)
+            if reserved_at is not None:
+                self.claim_latencies.append(time.monotonic() - reserved_at)
+            self._wake.set()
+        return output
+
+    def stats(self):
+        counts = {}
+        for release, state, key, deployment in self._members():
+            if release in self._reserved:
+                state = "claiming"
+            entry = counts.setdefault(f"{key[0]}:{key[1]}", {"ready": 0, "warming": 0, "claiming": 0})
+            entry[state] = entry.get(state, 0) + 1
+
+        latencies = sorted(self.claim_latencies)
+        lookups = self.hits + self.misses
+        return {
+            "targets": {f"{server_type}:{version}": count for (server_type, version), count in self.targets.items()},
+            "members": counts,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "claim_latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "claim_latency_max": latencies[-1] if latencies else None,
+        }
+
+    def _refill(self):
+        with self._lock:
+            self._expire_reservations()
+        members = self._members()
+        for release, state, key, deployment in members:
+            self._installing.pop(release, None)
+        counts = {}
+        for key in self._installing.values():
+            counts[key] = counts.get(key, 0) + 1
+
+        for release, state, key, deployment in members:
+            if release in self._reserved:
+                continue
+            counts[key] = counts.get(key, 0) + 1
+
+            # The world has been generated once the server is up, park it stopped
+            if state == "warming" and (deployment.status.available_replicas or 0) > 0:
+                self.release_engine.upgrade(
+                    release, deployment, {("replicaCount",): 0},
+                    labels={POOL_LABEL: "true", POOL_STATE_LABEL: "ready"},
+                )
+
+        for key, target in self.targets.items():
+            for _ in range(target - counts.get(key, 0)):
+                release = "mc-" + str(uuid4())
+                values = self.base_values(*key)
+                port = self.port_allocator.reserve() if self.port_allocator else None
+                if port is not None:
+                    values["minecraftServer"]["nodePort"] = port
+                print(f"Adding {release} to the warm pool for {key[0]}:{key[1]}")
+                try:
+                    self.release_engine.install(
+                        release, values, labels={POOL_LABEL: "true", POOL_STATE_LABEL: "warming"}
+                    )
+                except Exception:
+                    if port is not None:
+                        self.port_allocator.release(port)
+                    raise
+                self._installing[release] = key
+
+    def _run(self):
+        while True:
+            try:
+                self._refill()
+            except Exception as e:
+                print(f"Error refilling warm pool: {e}")
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
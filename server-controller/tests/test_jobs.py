@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from jobs import JobQueue, QueueFullError  # noqa: E402
+
+
+def recorder(log, name, output="ok"):
+    def run():
+        log.append(name)
+        return output
+    return run
+
+
+def blocker(log, name):
+    """A job that signals `started` and then runs until `release` is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def run():
+        log.append(name)
+        started.set()
+        release.wait(5)
+        return "ok"
+    return run, started, release
+
+
+def test_create_is_never_superseded():
+    log = []
+    jobs = JobQueue(workers=2)
+    create = jobs.submit("mc-new", "create", recorder(log, "create"))
+    stop = jobs.submit("mc-new", "stop", recorder(log, "stop"))
+    jobs.start()
+
+    assert stop.wait(5)
+    assert create.status == "succeeded"
+    assert stop.status == "succeeded"
+    assert log == ["create", "stop"]
+
+
+def test_jobs_behind_a_create_still_collapse():
+    log, superseded = [], []
+    jobs = JobQueue(workers=2)
+    create = jobs.submit("mc-new", "create", recorder(log, "create"))
+    stop = jobs.submit("mc-new", "stop", recorder(log, "stop"), on_superseded=lambda: superseded.append("stop"))
+    start = jobs.submit("mc-new", "start", recorder(log, "start"))
+    jobs.start()
+
+    assert start.wait(5)
+    assert create.status == "succeeded"
+    assert stop.status == "superseded" and stop.superseded_by == start.id
+    assert superseded == ["stop"]
+    assert log == ["create", "start"]
+
+
+def test_pending_job_replaced_while_server_busy():
+    log, superseded = [], []
+    jobs = JobQueue(workers=2)
+    jobs.start()
+    run, started, release = blocker(log, "first")
+    first = jobs.submit("mc-1", "start", run)
+    assert started.wait(5)
+    stop = jobs.submit("mc-1", "stop", recorder(log, "stop"), on_superseded=lambda: superseded.append("stop"))
+    start = jobs.submit("mc-1", "start", recorder(log, "start"))
+    release.set()
+
+    assert start.wait(5)
+    assert first.status == "succeeded"
+    assert stop.status == "superseded"
+    assert superseded == ["stop"]
+    assert log == ["first", "start"]
+
+
+def test_pending_delete_is_never_replaced():
+    log, superseded = [], []
+    jobs = JobQueue(workers=2)
+    delete = jobs.submit("mc-1", "delete", recorder(log, "delete"))
+    start = jobs.submit("mc-1", "start", recorder(log, "start"), on_superseded=lambda: superseded.append("start"))
+
+    assert start.status == "superseded" and start.superseded_by == delete.id
+    assert superseded == ["start"]
+    jobs.start()
+    assert delete.wait(5)
+    assert log == ["delete"]
+
+
+def test_failed_output_marks_job_failed():
+    jobs = JobQueue(workers=1)
+    job = jobs.submit("mc-1", "start", lambda: "Error: boom")
+    jobs.start()
+    assert job.wait(5)
+    assert job.status == "failed"
+
+
+def test_queue_full():
+    jobs = JobQueue(workers=1, max_pending=2)
+    jobs.submit("mc-1", "start", lambda: "ok")
+    jobs.submit("mc-2", "start", lambda: "ok")
+    # Another job for a server that already has one pending still fits
+    jobs.submit("mc-2", "stop", lambda: "ok")
+    with pytest.raises(QueueFullError):
+        jobs.submit("mc-3", "start", lambda: "ok")
+    assert jobs.depth() == 2
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from port_allocator import PortAllocationError, PortAllocator, parse_port_range  # noqa: E402
+
+PORTS = (30000, 30004)
+
+
+def service(name, *node_ports):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(namespace="default", name=name),
+        spec=SimpleNamespace(ports=[SimpleNamespace(node_port=port) for port in node_ports]),
+    )
+
+
+def test_parse_port_range():
+    assert parse_port_range("30000-32767") == (30000, 32767)
+    assert parse_port_range("31000") == (31000, 31000)
+    with pytest.raises(ValueError):
+        parse_port_range("32000-31000")
+
+
+def test_reserves_in_order_until_exhausted():
+    allocator = PortAllocator(PORTS)
+    assert [allocator.reserve(now=0) for _ in range(5)] == [30000, 30001, 30002, 30003, 30004]
+    with pytest.raises(PortAllocationError):
+        allocator.reserve(now=0)
+
+
+def test_skips_ports_used_by_services():
+    allocator = PortAllocator(PORTS)
+    allocator.on_service_event("ADDED", service("a", 30000, 30001))
+    allocator.on_service_event("ADDED", service("elsewhere", 40000))
+    assert allocator.reserve(now=0) == 30002
+    with pytest.raises(PortAllocationError):
+        allocator.reserve_port(30001, now=0)
+    with pytest.raises(PortAllocationError):
+        allocator.reserve_port(40000, now=0)
+
+
+def test_reservation_expires():
+    allocator = PortAllocator(PORTS, reservation_ttl=10)
+    assert allocator.reserve(now=0) == 30000
+    assert allocator.reserve(now=5) == 30001
+    # 30000's reservation ran out; it never had a Service, so it's reused first
+    assert allocator.reserve(now=11) == 30000
+
+
+def test_reservation_confirmed_by_service_does_not_expire():
+    allocator = PortAllocator(PORTS, reservation_ttl=10)
+    port = allocator.reserve(now=0)
+    allocator.on_service_event("ADDED", service("mc-1", port))
+    assert allocator.reserve(now=100) == 30001
+    assert allocator.stats()["used"] == 1
+
+
+def test_released_reservation_is_reused_first():
+    allocator = PortAllocator(PORTS)
+    port = allocator.reserve(now=0)
+    allocator.release(port, now=0)
+    assert allocator.reserve(now=0) == port
+
+
+@pytest.mark.parametrize("reuse, expected", [("fifo", 30001), ("lifo", 30000)])
+def test_freed_port_reuse_order(reuse, expected):
+    allocator = PortAllocator(PORTS, reuse=reuse)
+    port = allocator.reserve(now=0)
+    allocator.on_service_event("ADDED", service("mc-1", port))
+    allocator.on_service_event("DELETED", service("mc-1", port))
+    assert allocator.reserve(now=0) == expected
+
+
+def test_freed_port_waits_out_reuse_delay():
+    allocator = PortAllocator(PORTS, reuse="lifo", reuse_delay=30)
+    port = allocator.reserve(now=0)
+    allocator.on_service_event("ADDED", service("mc-1", port))
+    allocator.on_service_event("DELETED", service("mc-1", port))
+    now = time.monotonic()
+    assert allocator.reserve(now=now) == 30001
+    assert allocator.stats()["cooling_down"] == 1
+    assert allocator.reserve(now=now + 31) == port
+
+
+def test_port_shared_by_two_services_stays_taken_until_both_go():
+    allocator = PortAllocator(PORTS, reuse="lifo")
+    allocator.on_service_event("ADDED", service("a", 30000))
+    allocator.on_service_event("ADDED", service("b", 30000))
+    allocator.on_service_event("DELETED", service("a", 30000))
+    with pytest.raises(PortAllocationError):
+        allocator.reserve_port(30000, now=0)
+    allocator.on_service_event("DELETED", service("b", 30000))
+    assert allocator.reserve_port(30000, now=0) == 30000
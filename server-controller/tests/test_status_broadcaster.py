@@ -0,0 +1,122 @@
+import json
+import os
+import queue
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from status_broadcaster import StatusBroadcaster  # noqa: E402
+
+
+def parse(text):
+    """Splits a batch of SSE text into (id, event, data) tuples."""
+    events = []
+    for block in filter(None, text.split("\n\n")):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def drain(subscriber):
+    events = []
+    while True:
+        try:
+            events.extend(parse(subscriber.queue.get_nowait()))
+        except queue.Empty:
+            return events
+
+
+def test_new_subscriber_gets_snapshot():
+    broadcaster = StatusBroadcaster(collect=None)
+    broadcaster.publish([{"name": "mc-1", "status": "running"}])
+    [(event_id, event, data)] = drain(broadcaster.subscribe())
+    assert event == "snapshot"
+    assert event_id == broadcaster.last_event_id
+    assert data == [{"name": "mc-1", "status": "running"}]
+
+
+def test_publish_sends_only_changes():
+    broadcaster = StatusBroadcaster(collect=None)
+    broadcaster.publish([{"name": "mc-1", "status": "running", "players": 0}, {"name": "mc-2", "status": "stopped"}])
+    subscriber = broadcaster.subscribe()
+    drain(subscriber)
+
+    broadcaster.publish([{"name": "mc-1", "status": "running", "players": 3}, {"name": "mc-3", "status": "starting"}])
+    events = [(event, data) for _, event, data in drain(subscriber)]
+    assert events == [
+        ("patch", {"name": "mc-1", "set": {"players": 3}, "unset": []}),
+        ("patch", {"name": "mc-3", "set": {"name": "mc-3", "status": "starting"}, "unset": []}),
+        ("remove", {"name": "mc-2"}),
+    ]
+
+    # Nothing changed, nothing sent
+    broadcaster.publish([{"name": "mc-1", "status": "running", "players": 3}, {"name": "mc-3", "status": "starting"}])
+    assert drain(subscriber) == []
+
+
+def test_unset_fields_are_reported():
+    broadcaster = StatusBroadcaster(collect=None)
+    broadcaster.publish([{"name": "mc-1", "status": "running", "error": "x"}])
+    subscriber = broadcaster.subscribe()
+    drain(subscriber)
+    broadcaster.publish([{"name": "mc-1", "status": "running"}])
+    [(_, event, data)] = drain(subscriber)
+    assert (event, data) == ("patch", {"name": "mc-1", "set": {}, "unset": ["error"]})
+
+
+def test_resume_from_current_id_gets_nothing():
+    broadcaster = StatusBroadcaster(collect=None)
+    broadcaster.publish([{"name": "mc-1", "status": "running"}])
+    assert drain(broadcaster.subscribe(last_event_id=broadcaster.last_event_id)) == []
+
+
+def test_resume_from_older_id_gets_only_missed_patches():
+    broadcaster = StatusBroadcaster(collect=None)
+    broadcaster.publish([{"name": "mc-1", "status": "running"}])
+    seen = broadcaster.last_event_id
+    broadcaster.publish([{"name": "mc-1", "status": "stopped"}])
+    broadcaster.publish([{"name": "mc-1", "status": "stopped"}, {"name": "mc-2", "status": "running"}])
+
+    events = drain(broadcaster.subscribe(last_event_id=seen))
+    assert [event_id for event_id, _, _ in events] == [seen + 1, seen + 2]
+    assert [(event, data["name"]) for _, event, data in events] == [("patch", "mc-1"), ("patch", "mc-2")]
+
+
+def test_resume_from_id_outside_history_gets_snapshot():
+    broadcaster = StatusBroadcaster(collect=None, history_size=2)
+    broadcaster.publish([{"name": "mc-1", "status": "running"}])
+    old = broadcaster.last_event_id
+    for status in ("a", "b", "c"):
+        broadcaster.publish([{"name": "mc-1", "status": status}])
+
+    [(_, event, data)] = drain(broadcaster.subscribe(last_event_id=old))
+    assert event == "snapshot"
+    assert data == [{"name": "mc-1", "status": "c"}]
+    # An id from the future (e.g. another process) can't be resumed either
+    [(_, event, _)] = drain(broadcaster.subscribe(last_event_id=broadcaster.last_event_id + 10))
+    assert event == "snapshot"
+
+
+def test_slow_subscriber_catches_up_with_snapshot():
+    broadcaster = StatusBroadcaster(collect=None, queue_size=2)
+    subscriber = broadcaster.subscribe()
+    for players in range(5):
+        broadcaster.publish([{"name": "mc-1", "players": players}])
+
+    events = drain(subscriber)
+    # The backlog was replaced by a snapshot, so the client never holds more than its queue
+    assert events[0][1] == "snapshot" and events[0][2] != []
+    assert len(events) <= 2
+    # Replaying what the client got ends at the current state
+    state = {}
+    for _, event, data in events:
+        if event == "snapshot":
+            state = {item["name"]: dict(item) for item in data}
+        elif event == "patch":
+            item = state.setdefault(data["name"], {})
+            item.update(data["set"])
+            for field in data["unset"]:
+                item.pop(field, None)
+        else:
+            state.pop(data["name"], None)
+    assert list(state.values()) == [{"name": "mc-1", "players": 4}]
@@ -1,4 +1,5 @@
 import {
+  Autocomplete,
   Button,
   Checkbox,
   Container,
@@ -13,7 +14,7 @@ import {
   Typography,
 } from '@mui/material';
 import axios from 'axios';
-import { useState } from 'react';
+import { useEffect, useState } from 'react';
 
 const BASE_URL = process.env.REACT_APP_API_GATEWAY_URL;
 
@@ -25,11 +26,36 @@ const CreateServerForm = () => {
   const [difficulty, setDifficulty] = useState('');
   const [gameMode, setGameMode] = useState('');
   const [persistence, setPersistence] = useState(true);
-  const [port, setPort] = useState(30000);
+  // Empty port lets the server controller pick a free one
+  const [port, setPort] = useState('');
+  // Optional template the server starts from; the fields above override it
+  const [template, setTemplate] = useState(null);
+  const [templateInput, setTemplateInput] = useState('');
+  const [templateOptions, setTemplateOptions] = useState([]);
 
   const [status, setStatus] = useState('');
   const [disableBtn, setDisableBtn] = useState(false);
 
+  // Suggest templates whose name starts with what's typed so far
+  useEffect(() => {
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(
+          `${BASE_URL}/server-templates/autocomplete`,
+          { params: { prefix: templateInput } }
+        );
+        if (!cancelled) setTemplateOptions(response.data.templates);
+      } catch (error) {
+        console.error('Error fetching template suggestions:', error);
+      }
+    }, 200);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [templateInput]);
+
   // Function to handle form submission
   const handleCreateServer = async (e) => {
     e.preventDefault(); // Prevent default form submission
@@ -39,11 +65,12 @@ const CreateServerForm = () => {
       serverName: serverName || 'Minecraft Server',
       minecraftServer: {
         eula: true,
-        gameMode: gameMode || 'creative',
-        difficulty: difficulty || 'peaceful',
-        motd: motd || 'A sample MOTD',
+        // With a template, fields left empty come from the template instead
+        gameMode: gameMode || (template ? undefined : 'creative'),
+        difficulty: difficulty || (template ? undefined : 'peaceful'),
+        motd: motd || (template ? undefined : 'A sample MOTD'),
         serviceType: 'NodePort',
-        nodePort: port || 30000,
+        ...(port ? { nodePort: port } : {}),
       },
       persistence: {
         dataDir: {
@@ -58,12 +85,13 @@ const CreateServerForm = () => {
       // Send a POST request to create the server
       const response = await axios.post(
         `${BASE_URL}/servers/create`,
-        serverData
+        serverData,
+        template ? { params: { template: template.id } } : {}
       );
       setDisableBtn(true);
 
-      if (response.status === 200) {
-        setStatus('Server created.');
+      if (response.status === 202) {
+        setStatus('Server creation queued.');
         setDisableBtn(false);
       } else {
         setStatus('Failed to initiate server creation.');
@@ -89,10 +117,8 @@ const CreateServerForm = () => {
     // Validate server name (e.g., must not be empty)
     tempErrors.serverName = serverName ? '' : 'Server name is required';
 
-    // Validate port (e.g., must be between 30000 and 32767)
-    if (!port) {
-      tempErrors.port = 'Port is required';
-    } else if (isNaN(port) || port < 30000 || port > 32767) {
+    // Validate port (optional, must be between 30000 and 32767)
+    if (port && (isNaN(port) || port < 30000 || port > 32767)) {
       tempErrors.port = 'Port must be a number between 30000 and 32767';
     } else {
       tempErrors.port = '';
@@ -151,6 +177,25 @@ const CreateServerForm = () => {
         <Grid2 container spacing={2}>
           <Grid2>
             <FormGroup>
+              <Autocomplete
+                options={templateOptions}
+                value={template}
+                onChange={(e, value) => setTemplate(value)}
+                inputValue={templateInput}
+                onInputChange={(e, value) => setTemplateInput(value)}
+                getOptionLabel={(option) => option.templateName}
+                isOptionEqualToValue={(option, value) => option.id === value.id}
+                // Already filtered by the server
+                filterOptions={(options) => options}
+                renderInput={(params) => (
+                  <TextField
+                    {...params}
+                    label="Template"
+                    margin="normal"
+                    placeholder="None"
+                  />
+                )}
+              />
               <TextField
                 label="Server Name"
                 variant="outlined"
@@ -226,12 +271,13 @@ const CreateServerForm = () => {
                 margin="normal"
                 value={port}
                 type="number"
-                onChange={(e) => setPort(Number(e.target.value))}
-                placeholder="30000"
-                error={port < 30000 || port > 32767} // Shows error state
+                onChange={(e) => setPort(e.target.value ? Number(e.target.value) : '')}
+                placeholder="Automatic"
+                error={!!port && (port < 30000 || port > 32767)} // Shows error state
                 helperText={
-                  (port < 30000 || port > 32767) &&
-                  'Port must be between 30000 and 32767'
+                  !!port && (port < 30000 || port > 32767)
+                    ? 'Port must be between 30000 and 32767'
+                    : 'Leave empty to pick a free port'
                 } // Shows error message
               />
             </FormGroup>
@@ -244,7 +290,6 @@ const CreateServerForm = () => {
           disabled={
             disableBtn ||
             !serverName ||
-            !port ||
             !!errors.serverName ||
             !!errors.port
           }
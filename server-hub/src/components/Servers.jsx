@@ -39,19 +39,46 @@ export default function Servers() {
   useEffect(() => {
     const eventSource = new EventSource(`${BASE_URL}/servers/status/all`); // API Gateway URL
 
-    eventSource.onmessage = (event) => {
+    // The first event is a full snapshot, followed by per-server patches that
+    // only carry the fields that changed. EventSource resends the last event
+    // id on reconnect, so the backend only replays what was missed.
+    eventSource.addEventListener('snapshot', (event) => {
       try {
-        // The data in Server-Sent Events is prefixed with "data:", so we need to remove it
-        console.log(event);
-        const cleanData = event.data.replace(/^data:\s*/, ''); // Remove "data:" part
-        console.log(cleanData);
-        const parsedData = JSON.parse(cleanData);
-        setServerList(parsedData);
-        console.log(parsedData);
+        setServerList(JSON.parse(event.data));
       } catch (error) {
-        console.error('Error parsing data', error);
+        console.error('Error parsing snapshot', error);
       }
-    };
+    });
+
+    eventSource.addEventListener('patch', (event) => {
+      try {
+        const patch = JSON.parse(event.data);
+        setServerList((prev) => {
+          const index = prev.findIndex((server) => server.name === patch.name);
+          const server = index === -1 ? {} : { ...prev[index] };
+          Object.assign(server, patch.set);
+          patch.unset.forEach((field) => delete server[field]);
+
+          if (index === -1) {
+            return [...prev, server];
+          }
+          const next = [...prev];
+          next[index] = server;
+          return next;
+        });
+      } catch (error) {
+        console.error('Error parsing patch', error);
+      }
+    });
+
+    eventSource.addEventListener('remove', (event) => {
+      try {
+        const { name } = JSON.parse(event.data);
+        setServerList((prev) => prev.filter((server) => server.name !== name));
+      } catch (error) {
+        console.error('Error parsing remove', error);
+      }
+    });
 
     // Clean up when the component unmounts
     return () => {
@@ -16,21 +16,33 @@ db = db.getSiblingDB('mcTemplatesDb');
 db.createCollection('templates');
 
 db.serverTemplates.createIndex({ templateName: 1 }, { unique: true });
+db.serverTemplates.createIndex({ worldType: 1, templateName: 1 });
+db.serverTemplates.createIndex({ difficulty: 1, templateName: 1 });
+db.serverTemplates.createIndex({ mods: 1, templateName: 1 });
+db.serverTemplates.createIndex({ templateNameLower: 1 });
+db.serverTemplates.createIndex(
+  { templateName: 'text', description: 'text' },
+  { name: 'templateSearch', weights: { templateName: 5 } }
+);
 
 db.serverTemplates.insertMany([
   {
     templateName: 'Survival Mode',
+    templateNameLower: 'survival mode',
     description: 'Default survival mode template.',
     worldType: 'NORMAL',
     difficulty: 'EASY',
     mods: [],
+    version: 1,
   },
   {
     templateName: 'Creative Mode',
+    templateNameLower: 'creative mode',
     description: 'Unleash your creativity with unlimited resources.',
     worldType: 'CREATIVE',
     difficulty: 'PEACEFUL',
     mods: ['BuildCraft', 'IndustrialCraft'],
+    version: 1,
   },
   // Add more templates as needed
 ]);
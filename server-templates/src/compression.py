@@ -0,0 +1,104 @@
+import gzip
+import zlib
+
+import brotli
+from flask import request
+
+# Preferred first
+ENCODINGS = ("br", "gzip")
+# Bodies smaller than this aren't worth the CPU
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html")
+
+
+def negotiate_encoding(accept_encodings):
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        # Quality 11 (the default) is far too slow for per-request use
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Compresses a streamed body as it's generated."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        finish = compressor.finish
+        compress_chunk = compressor.process
+    else:
+        # wbits 31: gzip framing
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        finish = compressor.flush
+        compress_chunk = compressor.compress
+    try:
+        for chunk in chunks:
+            data = compress_chunk(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # Lets the wrapped generator clean up (e.g. close its database cursor)
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+# A strong ETag has to differ between the plain and the compressed body, so the
+# encoding is appended to it ("v1" -> "v1-br"). When comparing, any variant of
+# the same version counts as a match.
+def encoded_etag(etag, encoding):
+    return f"{etag}-{encoding}"
+
+
+def strip_encoding(etag):
+    for encoding in ENCODINGS:
+        if etag.endswith(f"-{encoding}"):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+# Function to check a request's If-None-Match against the current version.
+# Returns the tag the client sent, to echo back in the 304, or None.
+def matching_etag(etag, if_none_match):
+    for tag in if_none_match.as_set(include_weak=True):
+        if strip_encoding(tag) == etag:
+            return tag
+    return None
+
+
+def compress_responses(app):
+    """Compress JSON and text responses for clients that accept br or gzip."""
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            # Length unknown up front, so no size check
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < MIN_SIZE:
+                return response
+            response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak)
+        return response
@@ -1,16 +1,100 @@
+import re
+
+# Kept on every template for case-insensitive prefix lookups; never returned
+SEARCH_NAME_FIELD = "templateNameLower"
+
+
 def format_document_response(data: dict | list):
     formatted = {}
     if isinstance(data, dict):
         formatted = {
             "id": str(data["_id"]),  # Convert ObjectId to string
-            **{key: value for key, value in data.items() if key != "_id"}
+            **{key: value for key, value in data.items() if key not in ("_id", SEARCH_NAME_FIELD)}
         }
     elif isinstance(data, list):
         formatted = []
         for item in data:
             formatted.append({
                 "id": str(item["_id"]),  # Convert ObjectId to string
-                **{key: value for key, value in item.items() if key != "_id"}
+                **{key: value for key, value in item.items() if key not in ("_id", SEARCH_NAME_FIELD)}
             })
 
     return formatted
+
+
+# Template fields that listings can be filtered on with ?<field>=<value>
+LIST_FILTERS = ("worldType", "difficulty")
+# Listings can be sorted, and paged with a cursor, on either of these
+LIST_SORT_FIELDS = ("templateName", "_id")
+
+
+def parse_fields(value):
+    """Parses ?fields=templateName,mods into a list of field names, or None for all fields."""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    for field in fields:
+        if field.startswith("$") or not all(part for part in field.split(".")):
+            raise ValueError(f"invalid field {field}")
+    return [field for field in fields if field not in ("id", "_id")]
+
+
+def template_projection(fields, sort_field):
+    """
+    Pipeline stages that shape templates like format_document_response does
+    (`_id` becomes a string `id`), keeping only `fields` if given. The sort
+    field is always kept, since it is what the next page's cursor is made of.
+    """
+    if fields is None:
+        return [
+            {"$replaceWith": {"$mergeObjects": [{"id": {"$toString": "$_id"}}, "$$ROOT"]}},
+            {"$unset": ["_id", SEARCH_NAME_FIELD]},
+        ]
+    projection = {"_id": 0, "id": {"$toString": "$_id"}}
+    for field in fields:
+        projection[field] = 1
+    if sort_field != "_id" and sort_field not in fields:
+        projection[sort_field] = 1
+    return [{"$project": projection}]
+
+
+def with_search_fields(template: dict):
+    """Sets the derived search fields on a template (or a $set) that has a templateName."""
+    template.pop(SEARCH_NAME_FIELD, None)
+    if isinstance(template.get("templateName"), str):
+        template[SEARCH_NAME_FIELD] = template["templateName"].lower()
+    return template
+
+
+def search_query(text=None, filters=None, mods=None):
+    """
+    Builds the query and sort for a template search: full-text over name and
+    description (best matches first), exact matches on `filters`, and
+    templates that have every one of `mods`.
+    """
+    query = dict(filters or {})
+    if mods:
+        query["mods"] = mods[0] if len(mods) == 1 else {"$all": mods}
+    if text:
+        query["$text"] = {"$search": text}
+        return query, [("score", {"$meta": "textScore"}), ("templateName", 1)]
+    return query, [("templateName", 1)]
+
+
+def autocomplete_query(prefix):
+    """Case-insensitive prefix match on the name; anchored, so it's a range scan of the index."""
+    if not prefix:
+        return {}
+    return {SEARCH_NAME_FIELD: {"$regex": "^" + re.escape(prefix.lower())}}
+
+
+def plan_stages(plan):
+    """Every stage name in an explain() plan, however deeply nested."""
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
@@ -0,0 +1,50 @@
+import time
+
+from flask import g, request
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ["method", "endpoint", "status"]
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "Time spent in MongoDB commands", ["command", "result"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+TEMPLATE_CACHE_REQUESTS = Counter("template_cache_requests_total", "Template cache lookups", ["result"])
+TEMPLATE_CACHE_ENTRIES = Gauge("template_cache_entries", "Templates and listing pages held in the cache")
+TEMPLATE_CACHE_STALENESS = Histogram(
+    "template_cache_staleness_seconds", "Time from a template write until the cache dropped the old version",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Feeds the duration pymongo measures for every command into a histogram."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
+
+
+def track_requests(app):
+    """Record the latency of every request, labelled by route rather than raw path."""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_REQUEST_DURATION.labels(request.method, endpoint, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
@@ -0,0 +1,69 @@
+from helpers import LIST_FILTERS, SEARCH_NAME_FIELD, autocomplete_query, plan_stages, search_query
+
+MAX_SEARCH_LIMIT = 100
+# Each listing filter with the default sort after it, so a filtered page is
+# read in order straight off the index
+LIST_INDEXES = [[(field, 1), ("templateName", 1)] for field in LIST_FILTERS]
+# Indexes behind /template/search and /template/autocomplete. mods is an
+# array, so its index is multikey: one entry per mod.
+SEARCH_INDEXES = [
+    ([("templateName", "text"), ("description", "text")], {"name": "templateSearch", "weights": {"templateName": 5}}),
+    ([("mods", 1), ("templateName", 1)], {}),
+    ([(SEARCH_NAME_FIELD, 1)], {}),
+]
+# One query (and sort) of each shape the search endpoints send. None of them
+# may be planned as a collection scan.
+SEARCH_PLAN_CHECKS = {
+    "text": search_query("survival"),
+    "text+difficulty": search_query("survival", {"difficulty": "EASY"}),
+    "worldType": search_query(filters={"worldType": "NORMAL"}),
+    "difficulty": search_query(filters={"difficulty": "EASY"}),
+    "mod": search_query(mods=["BuildCraft"]),
+    "mods": search_query(mods=["BuildCraft", "IndustrialCraft"]),
+    "autocomplete": (autocomplete_query("sur"), [(SEARCH_NAME_FIELD, 1)]),
+}
+
+
+def ensure_indexes(collection):
+    """Creates the indexes listing and search rely on; a no-op once they exist."""
+    collection.create_index("templateName", unique=True)
+    for keys in LIST_INDEXES:
+        collection.create_index(keys)
+    for keys, options in SEARCH_INDEXES:
+        collection.create_index(keys, **options)
+    # Templates written before the lowercase name was kept
+    collection.update_many(
+        {SEARCH_NAME_FIELD: {"$exists": False}, "templateName": {"$type": "string"}},
+        [{"$set": {SEARCH_NAME_FIELD: {"$toLower": "$templateName"}}}],
+    )
+
+
+def missing_indexes(collection):
+    """Key patterns of the expected indexes that don't exist."""
+    indexes = list(collection.list_indexes())
+    existing = [list(index["key"].items()) for index in indexes]
+    # A text index is listed under internal keys (_fts, _ftsx), so it's matched on being one
+    has_text_index = any("textIndexVersion" in index for index in indexes)
+    return [
+        str(keys) for keys in [[("templateName", 1)], *LIST_INDEXES, *(keys for keys, _ in SEARCH_INDEXES)]
+        if keys not in existing and not (keys[0][1] == "text" and has_text_index)
+    ]
+
+
+def query_plan(collection, query, sort):
+    """The stages of the winning plan for a search, outermost first."""
+    plan = collection.find(query, sort=sort, limit=MAX_SEARCH_LIMIT).explain()
+    return list(dict.fromkeys(plan_stages(plan["queryPlanner"]["winningPlan"])))
+
+
+def verify_indexes(collection):
+    """Checks every index exists and every search shape is planned on one."""
+    missing = missing_indexes(collection)
+    plans = {name: query_plan(collection, query, sort) for name, (query, sort) in SEARCH_PLAN_CHECKS.items()}
+    collection_scans = [name for name, stages in plans.items() if "COLLSCAN" in stages]
+    return {
+        "ok": not missing and not collection_scans,
+        "missing": missing,
+        "collection_scans": collection_scans,
+        "plans": plans,
+    }
@@ -0,0 +1,212 @@
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from metrics import TEMPLATE_CACHE_ENTRIES, TEMPLATE_CACHE_REQUESTS, TEMPLATE_CACHE_STALENESS
+
+# Server error codes meaning change streams aren't available (standalone server)
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40415)
+# Where the version counters behind listing ETags live
+VERSIONS_COLLECTION = "collectionVersions"
+
+
+class TemplateCache:
+    """
+    Read-through cache of formatted templates, listing pages and the
+    collection version the listing ETags are made from.
+
+    Entries are kept coherent with MongoDB, including writes made through
+    other replicas, by tailing a change stream on the collection and its
+    version counter: a change to a template drops that template and every
+    cached listing, a change to the counter drops the cached version. When
+    change streams aren't available (MongoDB isn't a replica set) the cache
+    falls back to polling `version_func` every `poll_interval` seconds and
+    drops everything when the version moves, so entries are at most that stale.
+
+    Until one of the two is running the cache is bypassed. At most
+    `max_entries` entries are kept, evicting the least recently used.
+    """
+
+    def __init__(self, collection, version_func, max_entries=1024, poll_interval=5, retry_delay=5):
+        self.collection = collection
+        self.version_func = version_func
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        # "change_stream", "polling", or None while neither is running
+        self.mode = None
+        self.hits = 0
+        self.misses = 0
+        self.last_staleness = None
+        self.last_sync = None
+        self._entries = OrderedDict()
+        self._version = None
+        # Bumped by every invalidation, so loads started before it aren't stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def generation(self):
+        """Read before loading a value, and pass it to `put`."""
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key) if self.mode else None
+            if value is None:
+                self.misses += 1
+                TEMPLATE_CACHE_REQUESTS.labels("miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        TEMPLATE_CACHE_REQUESTS.labels("hit").inc()
+        return value
+
+    def get_version(self):
+        """The collection version, read from MongoDB only when it may have moved."""
+        with self._lock:
+            if self.mode and self._version is not None:
+                return self._version
+            generation = self._generation
+        version = self.version_func()
+        with self._lock:
+            if self.mode and generation == self._generation:
+                self._version = version
+        return version
+
+    def put(self, key, value, generation):
+        with self._lock:
+            if not self.mode or generation != self._generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            TEMPLATE_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate(self, template_id=None):
+        """Drops one template (or all of them, without an id) and every listing."""
+        with self._lock:
+            self._generation += 1
+            if template_id is None:
+                self._entries.clear()
+                self._version = None
+            else:
+                for key in [key for key in self._entries if key[0] == "list" or key == ("template", template_id)]:
+                    del self._entries[key]
+            TEMPLATE_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate_version(self):
+        with self._lock:
+            self._generation += 1
+            self._version = None
+
+    def _record_staleness(self, written_at):
+        # How long the cache could have served the old version
+        if written_at is None:
+            return
+        if written_at.tzinfo is None:
+            written_at = written_at.replace(tzinfo=timezone.utc)
+        self.last_staleness = max(0.0, (datetime.now(timezone.utc) - written_at).total_seconds())
+        TEMPLATE_CACHE_STALENESS.observe(self.last_staleness)
+
+    def _on_change(self, change):
+        self.last_sync = time.monotonic()
+        written_at = change.get("wallTime")
+        if written_at is None and "clusterTime" in change:
+            written_at = datetime.fromtimestamp(change["clusterTime"].time, timezone.utc)
+        self._record_staleness(written_at)
+
+        if change.get("ns", {}).get("coll") == VERSIONS_COLLECTION:
+            self.invalidate_version()
+        elif "documentKey" in change:
+            self.invalidate(str(change["documentKey"]["_id"]))
+        else:
+            # drop, rename, invalidate: the whole collection is affected
+            self.invalidate()
+
+    def _watch(self):
+        resume_token = None
+        while True:
+            try:
+                with self.collection.database.watch(
+                    [{"$match": {"ns.coll": {"$in": [self.collection.name, VERSIONS_COLLECTION]}}}],
+                    resume_after=resume_token,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    # Anything may have changed while the stream was down
+                    self.invalidate()
+                    self.mode = "change_stream"
+                    self.last_sync = time.monotonic()
+                    print("Template cache following the change stream")
+                    while stream.alive:
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is None:
+                            self.last_sync = time.monotonic()
+                            continue
+                        self._on_change(change)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    print(f"Change streams unavailable ({e}), polling every {self.poll_interval}s")
+                    return
+                # e.g. the resume point fell off the oplog; start over
+                print(f"Error in template change stream: {e}")
+                resume_token = None
+            except PyMongoError as e:
+                print(f"Error in template change stream: {e}")
+            # Not coherent again until the stream is back
+            self.mode = None
+            time.sleep(self.retry_delay)
+
+    def _poll(self):
+        version = None
+        while True:
+            try:
+                current = self.version_func()
+                if current != version:
+                    self.invalidate()
+                    if version is not None:
+                        self._record_staleness(self._version_written_at())
+                    version = current
+                with self._lock:
+                    self._version = current
+                self.mode = "polling"
+                self.last_sync = time.monotonic()
+            except PyMongoError as e:
+                print(f"Error polling template version: {e}")
+                self.mode = None
+            time.sleep(self.poll_interval)
+
+    def _version_written_at(self):
+        counter = self.collection.database[VERSIONS_COLLECTION].find_one(
+            {"_id": self.collection.name}, {"updatedAt": 1}
+        )
+        return (counter or {}).get("updatedAt")
+
+    def _run(self):
+        self._watch()
+        self._poll()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+                "last_staleness_seconds": self.last_staleness,
+                "seconds_since_sync": round(time.monotonic() - self.last_sync, 3) if self.last_sync else None,
+            }
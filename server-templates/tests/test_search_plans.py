@@ -0,0 +1,72 @@
+"""
+Checks that every template search shape stays index-backed.
+
+Runs against the MongoDB in MONGO_URI, in a scratch database that is
+dropped afterwards; skipped when MONGO_URI is unset or unreachable.
+"""
+import os
+import sys
+from uuid import uuid4
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from helpers import SEARCH_NAME_FIELD, autocomplete_query, with_search_fields  # noqa: E402
+from search_indexes import SEARCH_PLAN_CHECKS, ensure_indexes, missing_indexes, query_plan  # noqa: E402
+
+MONGO_URI = os.environ.get("MONGO_URI")
+WORLD_TYPES = ("NORMAL", "FLAT", "AMPLIFIED", "CREATIVE")
+DIFFICULTIES = ("PEACEFUL", "EASY", "NORMAL", "HARD")
+MODS = ("BuildCraft", "IndustrialCraft", "Thaumcraft", "Create", "JourneyMap")
+
+
+def sample_templates(count):
+    for i in range(count):
+        yield {
+            "templateName": f"{'Survival' if i % 2 else 'Creative'} Template {i}",
+            "description": f"Sample template number {i} for {'survival' if i % 3 else 'building'} worlds.",
+            "worldType": WORLD_TYPES[i % len(WORLD_TYPES)],
+            "difficulty": DIFFICULTIES[i % len(DIFFICULTIES)],
+            "mods": [MODS[j % len(MODS)] for j in range(i, i + i % 3)],
+            "version": 1,
+        }
+
+
+@pytest.fixture(scope="module")
+def collection():
+    if not MONGO_URI:
+        pytest.skip("MONGO_URI is not set")
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"MongoDB at MONGO_URI is unreachable: {e}")
+
+    database = client[f"templateSearchTest_{uuid4().hex[:8]}"]
+    templates = list(sample_templates(500))
+    # Half written the way the API writes them, half as older templates without the lowercase name
+    database.serverTemplates.insert_many([with_search_fields(t) if i % 2 else t for i, t in enumerate(templates)])
+    ensure_indexes(database.serverTemplates)
+    yield database.serverTemplates
+    client.drop_database(database.name)
+    client.close()
+
+
+def test_indexes_exist(collection):
+    assert missing_indexes(collection) == []
+
+
+@pytest.mark.parametrize("name", SEARCH_PLAN_CHECKS)
+def test_search_is_index_backed(collection, name):
+    query, sort = SEARCH_PLAN_CHECKS[name]
+    assert "COLLSCAN" not in query_plan(collection, query, sort)
+
+
+def test_lowercase_names_backfilled(collection):
+    assert collection.count_documents({SEARCH_NAME_FIELD: {"$exists": False}}) == 0
+    names = [t["templateName"] for t in collection.find(autocomplete_query("SURVIVAL TEMPLATE 1"))]
+    assert names and all(name.startswith("Survival Template 1") for name in names)